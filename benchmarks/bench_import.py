@@ -0,0 +1,58 @@
+"""
+Cold-start cost: `import cuke` and constructing a Cuke, each in a fresh interpreter.
+
+Neither should touch the network or import requests. `--max-ms` makes the script exit non-zero
+when the median import time is over budget, so it can guard against regressions in CI.
+
+    python benchmarks/bench_import.py [--runs 20] [--max-ms 100]
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+
+HEAVY = ("requests", "urllib3", "httpx", "inspect", "concurrent.futures", "matplotlib", "numpy")
+
+IMPORT = """
+import time
+start = time.perf_counter()
+import cuke
+print(time.perf_counter() - start)
+"""
+
+CONSTRUCT = """
+import sys, time
+start = time.perf_counter()
+from cuke import Cuke
+c = Cuke(url="http://127.0.0.1:1", api_key="key", page_id="page", lazy=True)
+print(time.perf_counter() - start)
+print(",".join(m for m in HEAVY if m in sys.modules))
+"""
+
+
+def run(code):
+    out = subprocess.run([sys.executable, "-c", f"HEAVY = {HEAVY!r}\n{code}"], capture_output=True, text=True,
+                         check=True).stdout.split("\n")
+    return float(out[0]), out[1] if len(out) > 1 else ""
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--max-ms", type=float, default=None, help="fail if the median import takes longer")
+    args = parser.parse_args()
+
+    imports = [run(IMPORT)[0] for _ in range(args.runs)]
+    constructs = [run(CONSTRUCT) for _ in range(args.runs)]
+    heavy = constructs[-1][1]
+
+    median_ms = statistics.median(imports) * 1000
+    print(f"import cuke, median:           {median_ms:.1f} ms")
+    print(f"import + lazy Cuke(), median:  {statistics.median(t for t, _ in constructs) * 1000:.1f} ms")
+    print(f"heavy modules loaded:          {heavy or 'none'}")
+    if args.max_ms is not None and median_ms > args.max_ms:
+        sys.exit(f"import took {median_ms:.1f} ms, over the {args.max_ms:.1f} ms budget")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Cost of serializing a large /store payload, before and after single-pass encoding.
+
+"before" reproduces the old pipeline: a json.dumps probe per value (result thrown away), then the
+whole body encoded again for the request.
+"after" is what `_update` does now: each value encoded once, the body stitched from fragments.
+No network is involved.
+
+    python benchmarks/bench_serialize.py [--rows 200000] [--repeat 5]
+"""
+import argparse
+import json
+import time
+
+from cuke import Cuke, encoding
+
+
+def before(values):
+    update = {"__meta__": {}}
+    for k, v in values.items():
+        json.dumps(v)
+        update[k] = {"type": "basic", "value": v}
+    return json.dumps(update).encode()
+
+
+def after(cuke, values):
+    snapshot = {"keys": set(values), "meta": {}, "vars": values, "initial": False}
+    update = cuke._build_update(snapshot)
+    return cuke._encode_update(update, snapshot)
+
+
+def timed(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        body = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, len(body)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    values = {
+        "table": [{"id": i, "name": f"row {i}", "score": i * 0.5} for i in range(args.rows)],
+        "series": list(range(args.rows)),
+        "title": "benchmark",
+    }
+    cuke = Cuke(url="http://localhost")
+    t_before, size = timed(lambda: before(values), args.repeat)
+    print(f"payload: {size / 1e6:.1f} MB")
+    print(f"before (probe + encode):       {t_before * 1000:8.1f} ms")
+    for name in ("json", "orjson"):
+        try:
+            encoding.use_backend(name)
+        except ImportError:
+            print(f"after  ({name}): not installed")
+            continue
+        t_after, _ = timed(lambda: after(cuke, values), args.repeat)
+        print(f"after  ({name}):{' ' * (21 - len(name))}{t_after * 1000:8.1f} ms  ({t_before / t_after:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+Setattr throughput while an upload is in flight.
+
+Runs against the in-process stub server with a simulated slow network, one thread uploading in a
+loop while the main thread assigns variables. Writer latency should not depend on the upload.
+
+    python benchmarks/bench_setattr.py [--delay 0.2] [--seconds 2]
+"""
+import argparse
+import threading
+import time
+
+from cuke import Cuke
+from cuke.testing import StubServer
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--delay", type=float, default=0.2, help="simulated server latency, seconds")
+    parser.add_argument("--seconds", type=float, default=2.0)
+    args = parser.parse_args()
+
+    with StubServer() as server:
+        c = Cuke(user_agent="bench", url=server.url)
+        c._template = "{{ x }}"
+        c.x = 0
+        c._update()
+        server.delay = args.delay
+
+        done = threading.Event()
+        uploads = 0
+        def uploader():
+            nonlocal uploads
+            while not done.is_set():
+                if c._update():
+                    uploads += 1
+        thread = threading.Thread(target=uploader)
+        thread.start()
+
+        count, worst = 0, 0.0
+        end = time.perf_counter() + args.seconds
+        while time.perf_counter() < end:
+            start = time.perf_counter()
+            c.x = count
+            worst = max(worst, time.perf_counter() - start)
+            count += 1
+        done.set()
+        thread.join()
+
+    print(f"server latency:        {args.delay * 1000:.0f} ms")
+    print(f"uploads completed:     {uploads}")
+    print(f"setattr/s:             {count / args.seconds:,.0f}")
+    print(f"worst setattr latency: {worst * 1000:.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,34 +1,89 @@
 import base64
-import inspect
-import io
-import json
+import contextlib
 import os
 import threading
-import time
 import weakref
+from urllib.parse import urlencode
 
-import requests
-from requests.exceptions import HTTPError
-
+from cuke import aliases, chunks, compress, encoding, pagecache, remote, render, results
+from cuke import session as cuke_session
+from cuke.batch import CukeBatch, open_pages
+from cuke.delta import diff
 from cuke.errors import NoApiKey, NoPageYet, SetPageIdOnInitialization
-from cuke.types import Image
-from cuke.util import add_header_to_function, get_function_body, make_request_in_api_key_order
+from cuke.serializers import serializer_for
+from cuke.sync import PAGE_FIELDS, SyncResult
+from cuke.types import Image, Series
+from cuke.updater import Updater
+from cuke.util import DeferredFunction, digest, make_request_in_api_key_order
 
-KEYS_TO_NOT_UPDATE = {"_dirty_set", "_instant_updates", "_vars", "_vars_lock", "_daemon",
-                      "_contributor_key", "_editor_key", "_page_id", "_page_subslug", "_page_slug",
-                      "_views"}
+KEYS_TO_NOT_UPDATE = {"_dirty_set", "_instant_updates", "_vars", "_vars_lock", "_flush_lock", "_updater",
+                      "_contributor_key", "_editor_key", "_page_id", "_page_subslug", "_page_slug", "_slug", "_alias_pending",
+                      "_state_pending",
+                      "_views", "_session", "_timeout", "_pending_updates",
+                      "_update_lock", "_coalesce", "_coalesce_handle",
+                      "_dedupe", "_digests", "_file_stats", "_bytes_saved", "_delta_updates", "_acked",
+                      "_series_acked", "_binary_uploads", "_figure_options",
+                      "_chunk_threshold", "_chunk_size",
+                      "_compression", "_compression_threshold", "_compression_level", "_last_compressed",
+                      "_result_cache", "_lazy_keys", "_prefetch_keys", "_unloaded",
+                      "_revision"}
+REQUIRES_STORING = {"_template", "_frame_time", "_packages",
+                    "_ui_thread_js_for_loop_output", "_ui_thread_js_for_loop_input",
+                    "_webworker", "_setup", "_loop", "_event"}
+META_KEYS = ("_private", "_basic_auth", "_title")
+# page settings fetched with the variables, so a `lazy` Cuke fetches them on first read too
+FETCHED_SETTINGS = frozenset(PAGE_FIELDS.values()) | {"_frame_time", "_packages", "_ui_thread_js_for_loop_output",
+                                                      "_ui_thread_js_for_loop_input", "_webworker"}
+RETRIEVE_ANONYMOUS_ERROR_MSG = "because you're trying to connect to an existing page, but without authentication."
 
 class Cuke:
+    # Whether the constructor may talk to the server (alias lookup, fetching an existing page).
+    _connect_on_init = True
+    _alias_pending = False
+    _state_pending = False
+    _revision = None  # revision of the page state last fetched, if the server has revisions
+
     def __init__(self, url="https://cuke.cool", api_key=None, instant_updates=False,
                  page_slug=None, page_subslug=None, page_id=None, contributor_key=None,
-                 editor_key=None, private=False, **kwargs):
+                 editor_key=None, private=False, session=None, timeout=None, coalesce_latency=None,
+                 coalesce_batch_size=None, dedupe=False, delta_updates=False, binary_uploads=False,
+                 figure_options=None, chunk_threshold=None, chunk_size=chunks.DEFAULT_CHUNK_SIZE,
+                 compression=None, compression_threshold=compress.DEFAULT_THRESHOLD, compression_level=None,
+                 connect=True, lazy_alias=False, lazy=False, result_cache=None,
+                 lazy_keys=False, prefetch=None, **kwargs):
         self._dirty_set = set()
-        self._instant_updates = instant_updates
+        self._instant_updates = False  # set for real once constructed, so __init__ itself doesn't send
+        self._updater = None
         self._vars = {}
-        self._vars_lock = threading.Lock()
-        self._daemon = None
+        self._unloaded = {}  # key -> its manifest entry, for values a lazy_keys page hasn't fetched yet
+        self._vars_lock = threading.Lock()  # guards _vars and _dirty_set; never held during network I/O
+        self._flush_lock = threading.RLock()  # one flush at a time, so updates reach the server in order
         self._url = url
         self._api_key = api_key
+        self._session = session
+        self._timeout = timeout
+        # Don't resend values the server last acknowledged. Only safe if nothing else writes the page
+        # (buttons, `math`, remote functions): a server-side change is only noticed once it's fetched.
+        self._dedupe = dedupe
+        self._digests = {}  # key -> digest of the value as the server stores it, see `_entry_digest`
+        self._file_stats = {}  # key -> digest of the path and stat of the image file the server last acknowledged
+        self._bytes_saved = 0  # bytes not sent because the value hadn't changed
+        self._delta_updates = delta_updates
+        self._acked = {}  # key -> (version, copy of the JSON value the server last acknowledged)
+        self._series_acked = {}  # key -> (series id, index after the last point the server acknowledged)
+        self._binary_uploads = binary_uploads  # send bytes-like values as raw multipart parts, not base64
+        self._figure_options = dict(figure_options or {})  # key -> render options, see cuke.render
+        for options in self._figure_options.values():
+            render._options(**options)  # bad options fail here, not in every later _update
+        self._chunk_threshold = chunk_threshold  # upload payloads larger than this in chunks, see cuke.chunks
+        self._chunk_size = chunk_size
+        self._compression = compress.resolve(compression)  # see cuke.compress
+        self._compression_threshold = compression_threshold
+        self._compression_level = compression_level
+        self._last_compressed = None  # (digest of a body, the body compressed), reused when it's resent
+        self._result_cache = results.ResultCache() if result_cache is True else result_cache  # see cuke.results
+        self._lazy_keys = lazy_keys  # fetch a manifest of the keys, and each value on first read
+        self._prefetch_keys = tuple(prefetch or ())  # values to fetch along with the manifest
 
         if self._api_key is None:
             self._api_key = os.environ.get("CUKE_API_KEY", None)
@@ -39,7 +94,12 @@ class Cuke:
                 pass
         
         self._user_agent = kwargs.get("user_agent", None)
-        self._page_slug = page_slug or self._user_alias
+        connect = connect and self._connect_on_init
+        self._page_slug = page_slug
+        if page_slug is None and (lazy_alias or lazy):
+            self._alias_pending = True  # looked up by _page_slug when first needed
+        elif page_slug is None and connect:
+            self._page_slug = self._user_alias
         self._page_subslug = page_subslug
         self._page_id = page_id
         self._contributor_key = contributor_key
@@ -60,41 +120,110 @@ class Cuke:
 
         self._private = private
 
-        if self._page_id:
-            self._initialize_vars()
+        if self._page_id and connect:
+            if lazy:
+                self._state_pending = True  # fetched on the first read of a variable or setting, or flush
+            else:
+                self._initialize_vars()
         self._dirty_set = set()
 
+        if coalesce_latency is not None or coalesce_batch_size is not None:
+            self._updater = Updater(self, max_latency=coalesce_latency or 0.05, max_batch=coalesce_batch_size)
+        self._instant_updates = instant_updates
+
 
-    def _call_remote(self, key):
-        """Remote version of function with name `key`."""
+    def _execute_url(self, key):
         if self._page_subslug:
-            url = f"{self._url}/page/{self._page_slug}/{self._page_subslug}/{self._page_id}/execute/{key}"
+            return f"{self._url}/page/{self._page_slug}/{self._page_subslug}/{self._page_id}/execute/{key}"
+        return f"{self._url}/page/{self._page_slug}/{self._page_id}/execute/{key}"
+
+    def _call_remote(self, key, *args, **kwargs):
+        """Remote version of function with name `key`, called with `args` and `kwargs` if there are any."""
+        cache_key, cached = self._cached_result(key, args, kwargs)
+        if cached is not None and cached[2]:
+            return cached[0]
+        body = remote.call_body(args, kwargs)
+        headers = self._remote_headers(cached)
+        if body is None:
+            resp = self._http.get(self._execute_url(key), headers=headers, timeout=self._request_timeout)
         else:
-            url = f"{self._url}/page/{self._page_slug}/{self._page_id}/execute/{key}"
-        resp = requests.get(url, headers=self._headers(self._editor_key))
+            resp = self._http.post(self._execute_url(key), data=encoding.dumps(body),
+                                   headers={**headers, "Content-Type": "application/json"},
+                                   timeout=self._request_timeout)
+        return self._remote_result(resp, cache_key, cached)
+
+    def _cached_result(self, key, args, kwargs):
+        """(cache key, (text, etag, fresh) or None) for a call; (None, None) without a result cache."""
+        if self._result_cache is None:
+            return None, None
+        cache_key = self._result_cache.key(self._execute_url(key), self._vars.get(key), args, kwargs)
+        return cache_key, self._result_cache.lookup(cache_key)
+
+    def _remote_headers(self, cached):
+        headers = self._headers(self._editor_key)
+        if cached is not None:
+            headers["If-None-Match"] = cached[1]
+        return headers
+
+    def _remote_result(self, resp, cache_key, cached):
+        if resp.status_code == 304 and cached is not None:
+            self._result_cache.refresh(cache_key)
+            return cached[0]
         resp.raise_for_status()
+        if cache_key is not None:
+            self._result_cache.store(cache_key, resp.text, resp.headers.get("ETag"))
         return resp.text
-    
+
     class _CukeFun(object):
         """Function to be executed remotely."""
         def __init__(self, cuke, key):
             self._cuke = weakref.ref(cuke)
             self._key = key
 
-        def __call__(self, *args, **kwargs):
+        def _owner(self):
             cuke = self._cuke()
             if cuke is None:
                 raise RuntimeError("Cuke object has been garbage collected.")
-            return cuke._call_remote(self._key, *args, **kwargs)
+            return cuke
+
+        def __call__(self, *args, **kwargs):
+            return self._owner()._call_remote(self._key, *args, **kwargs)
+
+        def submit(self, *args, **kwargs):
+            """Call the function in the background; returns a `concurrent.futures.Future` of its result."""
+            return remote.executor().submit(self._owner()._call_remote, self._key, *args, **kwargs)
+
+        def map(self, iterable, concurrency=None, ordered=True):
+            """
+            Call the function once per item of `iterable`, passing the item as its only argument.
+
+            Parameters
+            ----------
+            iterable : iterable
+                The arguments; consumed lazily, so it can be a generator.
+            concurrency : int
+                How many calls to have in flight at once. Defaults to the connection pool size.
+            ordered : bool
+                Yield results in the order of `iterable`. If False, yield (item, result) pairs as
+                soon as each call finishes.
+            """
+            cuke, key = self._owner(), self._key
+            return remote.map_calls(lambda item: cuke._call_remote(key, item), iterable, concurrency, ordered)
 
 
     def __getattribute__(self, key):
         if not key.startswith("_"):
+            if self._state_pending:
+                self._load_pending_state()
+            if key in self._unloaded:
+                self._load_on_read(key)
             if callable(self._vars[key]):
                 fn = self._CukeFun(self, key)
                 fn.__doc__ = f"Remote version of function with name `{key}`."
                 return fn
             return self._vars[key]
+        if key in FETCHED_SETTINGS and self._state_pending:
+            self._load_pending_state()
         return super().__getattribute__(key)
     
 
@@ -103,188 +232,849 @@ class Cuke:
             with self._vars_lock:
                 self._vars[key] = val
                 self._dirty_set.add(key)
-                if self._instant_updates:
-                    self._update()
+                self._unloaded.pop(key, None)
+            if self._instant_updates:
+                self._instant_update()
+            elif self._updater is not None:
+                self._updater.notify(len(self._dirty_set))
         else:
             super().__setattr__(key, val)
             if key not in KEYS_TO_NOT_UPDATE:
-                self._dirty_set.add(key)
+                with self._vars_lock:
+                    self._dirty_set.add(key)
                 if self._instant_updates:
-                    self._update()
+                    self._instant_update()
+                elif self._updater is not None:
+                    self._updater.notify(len(self._dirty_set))
 
-    def __url_for(self, key):
+    def _instant_update(self):
+        if self._updater is not None:
+            self._updater.notify(len(self._dirty_set))
+        else:
+            self._update()
+
+    def _flush(self):
+        """
+        Send everything that is dirty now, rather than waiting for the coalescing deadline or the
+        background updater.
+        """
+        if self._updater is not None:
+            self._updater.cancel()
+        return self._update()
+
+    def _url_for(self, key):
         if self._page_subslug:
             return f"{self._url}/{key}/{self._page_slug}/{self._page_subslug}/{self._page_id}"
         return f"{self._url}/{key}/{self._page_slug}/{self._page_id}"
 
     @property
     def _page_url(self):
-        return self.__url_for("page")
+        return self._url_for("page")
+
+    @property
+    def _http(self):
+        """The injected session, or the pooled keep-alive session shared by every Cuke on this server."""
+        return self._session or cuke_session.get_session(self._url)
+
+    @property
+    def _request_timeout(self):
+        return self._timeout if self._timeout is not None else cuke_session.default_timeout()
 
     @property
     def _user_alias(self):
+        """The alias of the API key, from `cuke.aliases` if it's cached there, else from the server."""
         if self._api_key is None:
             return None
-        resp = requests.get(f"{self._url}/user/get_alias", headers=self._headers(self._api_key))
-        resp.raise_for_status()
-        return resp.json()["alias"]
+        alias = aliases.get(self._url, self._api_key)
+        if alias is None:
+            resp = self._http.get(f"{self._url}/user/get_alias", headers=self._headers(self._api_key),
+                                  timeout=self._request_timeout)
+            resp.raise_for_status()
+            alias = resp.json()["alias"]
+            aliases.put(self._url, self._api_key, alias)
+        return alias
+
+    @property
+    def _page_slug(self):
+        if self._alias_pending:
+            self._page_slug = self._user_alias
+        return self._slug
+
+    @_page_slug.setter
+    def _page_slug(self, slug):
+        self._slug = slug
+        self._alias_pending = False
 
     def _initialize_vars(self):
-        resp = make_request_in_api_key_order(requests.get, self, self.__url_for("retrieve"),
-                                             anonymous_error_msg="because you're trying to connect to an existing page, but without authentication.")
+        cached = self._cached_state()
+        resp = make_request_in_api_key_order(self._http.get, self, self._retrieve_url(),
+                                             anonymous_error_msg=RETRIEVE_ANONYMOUS_ERROR_MSG,
+                                             additional_headers=self._revalidation_headers(cached))
         if resp.status_code == 404:
             return False
-        
-        resp = resp.json()
-        
-        self._template = resp.pop("__template__")
-        self._basic_auth = resp.pop("__basic_auth__")
-        self._code = resp.pop("__code__")
-        self._private = resp.pop("__private__")
-        self._title = resp.pop("__title__")
-        self._views = resp.pop("__views__")
-        self._frame_time = self._code.get("frame_time")
-        self._packages = self._code.get("packages")
-        self._ui_thread_js_for_loop_output = self._code.get("ui_thread_js_for_loop_output")
-        self._ui_thread_js_for_loop_input = self._code.get("ui_thread_js_for_loop_input")
-        self._webworker = self._code.get("webworker")
+        self._apply_retrieved(self._retrieved_state(resp, cached))
+
+    def _cached_state(self):
+        """(etag, state) kept on disk for this page, see cuke.pagecache; None with `lazy_keys`."""
+        if self._lazy_keys:
+            return None
+        return pagecache.get(self._url_for("retrieve"))
+
+    @staticmethod
+    def _revalidation_headers(cached):
+        return {"If-None-Match": cached[0]} if cached is not None else None
+
+    def _retrieved_state(self, resp, cached):
+        """The page state in `resp`, or the copy on disk if the server says it hasn't changed."""
+        if resp.status_code == 304 and cached is not None:
+            return cached[1]
+        state = resp.json()
+        if not self._lazy_keys:
+            pagecache.put(self._url_for("retrieve"), resp.headers.get("ETag"), state)
+        return state
+
+    def _retrieve_url(self, keys=None):
+        """
+        /retrieve for the whole page state; with `lazy_keys`, for a manifest of its keys plus the
+        prefetched values; or, given `keys`, for just those values.
+        """
+        if keys is not None:
+            return f"{self._url_for('retrieve')}?{urlencode([('keys', k) for k in keys])}"
+        if self._lazy_keys:
+            query = [("manifest", 1)] + [("keys", k) for k in self._prefetch_keys]
+            return f"{self._url_for('retrieve')}?{urlencode(query)}"
+        return self._url_for("retrieve")
+
+    def _prefetch(self, *keys):
+        """
+        Fetch the values of `keys`, in one request, that a page loaded with `lazy_keys=True` hasn't
+        yet; otherwise each is fetched on its own when first read.
+        """
+        with self._flush_lock:
+            keys = [k for k in keys if k in self._unloaded]
+            if not keys:
+                return
+            resp = make_request_in_api_key_order(self._http.get, self, self._retrieve_url(keys),
+                                                 anonymous_error_msg=RETRIEVE_ANONYMOUS_ERROR_MSG)
+            resp.raise_for_status()
+            self._apply_fetched(keys, resp.json())
+
+    def _load_on_read(self, key):
+        self._prefetch(key)
+
+    def _apply_fetched(self, keys, entries):
+        """Load values fetched for `keys`, except any assigned locally in the meantime."""
+        for k in keys:
+            with self._vars_lock:
+                if self._unloaded.pop(k, None) is None or k not in entries:
+                    continue
+            self._apply_entry(k, entries[k])
+
+    def _attach(self):
+        """
+        Fetch an existing page's state, as the constructor does. None of it counts as dirty, and
+        whatever was assigned locally before it arrived is kept, still dirty. False if there's no
+        such page.
+        """
+        changes = self._local_changes()
+        with self._not_sending():
+            found = self._initialize_vars()
+        self._restore_local_changes(changes)
+        return found
+
+    def _load_pending_state(self):
+        """Fetch the page state that `Cuke(lazy=True)` didn't, the first time it's needed."""
+        with self._flush_lock:
+            if self._state_pending:
+                self._state_pending = False  # before attaching, which reads the settings itself
+                try:
+                    self._attach()
+                except BaseException:
+                    self._state_pending = True
+                    raise
+
+    def _local_changes(self):
+        with self._vars_lock:
+            dirty = set(self._dirty_set)
+            local = {k: self._vars[k] for k in dirty if k in self._vars}
+        return dirty, local, {k: getattr(self, k) for k in dirty if k.startswith("_")}
+
+    def _restore_local_changes(self, changes):
+        dirty, local, attrs = changes
+        for k, v in attrs.items():
+            super().__setattr__(k, v)
+        with self._vars_lock:
+            self._vars.update(local)
+            self._dirty_set = dirty
+            for k in dirty:
+                self._unloaded.pop(k, None)
 
+    @contextlib.contextmanager
+    def _not_sending(self):
+        """Assignments in the block don't trigger instant updates or wake the background updater."""
+        instant_updates, updater = self._instant_updates, self._updater
+        self._instant_updates, self._updater = False, None
+        try:
+            yield
+        finally:
+            self._instant_updates, self._updater = instant_updates, updater
+
+    def _apply_retrieved(self, resp):
+        """Load page state, as returned by /retrieve, into this object."""
+        self._apply_page_fields({field: resp.pop(field) for field in PAGE_FIELDS})
+        self._revision = resp.pop("__revision__", None)
+        manifest = resp.pop("__manifest__", False)
+        self._unloaded = {}
         for k in resp:
-            if resp[k]["type"] == "function":
-                fun = add_header_to_function(resp[k]["value"], k)
-                self._vars[k] = fun
+            if manifest and "value" not in resp[k]:
+                self._vars.pop(k, None)
+                self._unloaded[k] = resp[k]
             else:
-                self._vars[k] = resp[k]["value"]
-            # TODO may want to deserialize it back to a python obj, e.g. b64 string -> matplotlib figure
-            # which obv is impossible, but, maybe it could be a message "this was originally a matplotlib figure,
-            # we serialized it and now it's a PNG that looks like this"
-            # also functions, thought about it, not doing for now.
+                self._apply_entry(k, resp[k])
+
+    def _apply_page_fields(self, fields):
+        """Load page settings (template, code, ...), keyed by their /retrieve field names."""
+        for field, value in fields.items():
+            setattr(self, PAGE_FIELDS[field], value)
+        if "__code__" in fields:
+            self._frame_time = self._code.get("frame_time")
+            self._packages = self._code.get("packages")
+            self._ui_thread_js_for_loop_output = self._code.get("ui_thread_js_for_loop_output")
+            self._ui_thread_js_for_loop_input = self._code.get("ui_thread_js_for_loop_input")
+            self._webworker = self._code.get("webworker")
+
+    @staticmethod
+    def _entry_digest(entry):
+        """
+        Digest of a value as the server stores it, and /retrieve returns it, whatever form it was sent
+        in: `_drop_unchanged` takes the same digest of what it sends, so `_sync` can tell its own writes.
+        """
+        if entry.get("type") in ("series", "series_append"):
+            # appends are merged into the series, so it's identified by its id, where it ends and its tail
+            end = entry["start"] + len(entry["points"])
+            return digest(encoding.dumps([entry["id"], end, entry["tail"]]))
+        if "value" not in entry:
+            return digest(encoding.dumps(entry))
+        unversioned = {key: value for key, value in entry.items() if key != "version"}
+        return digest(encoding.entry_bytes(unversioned, encoding.dumps(entry["value"])))
+
+    @staticmethod
+    def _part_digest(entry, part):
+        """`_entry_digest` of an entry sent with a binary part, which the server stores as base64."""
+        head = encoding.entry_bytes({name: v for name, v in entry.items() if name != "part"}, b'""')[:-2]
+        return digest(head, *encoding.base64_chunks(part), b'"}')
+
+    def _apply_entry(self, k, entry):
+        """Load one retrieved value, as the server last acknowledged it."""
+        self._digests[k] = self._entry_digest(entry)
+        self._file_stats.pop(k, None)
+        if self._delta_updates and entry["type"] == "basic" and entry.get("version") is not None:
+            self._acked[k] = (entry["version"], encoding.loads(encoding.dumps(entry["value"])))
+        if entry["type"] == "function":
+            self._vars[k] = DeferredFunction(entry["value"], k)  # compiled if it's ever called
+        elif entry["type"] == "series":
+            self._vars[k] = Series._from_entry(entry)
+            self._series_acked[k] = (entry["id"], entry["start"] + len(entry["points"]))
+        else:
+            self._vars[k] = entry["value"]
+        # TODO may want to deserialize it back to a python obj, e.g. b64 string -> matplotlib figure
+        # which obv is impossible, but, maybe it could be a message "this was originally a matplotlib figure,
+        # we serialized it and now it's a PNG that looks like this"
+        # also functions, thought about it, not doing for now.
 
 
     def _headers(self, key):
         return {"User-Agent": self._user_agent, "Authorization": key}
 
 
-    def _sync(self):
-        f"""
-        Synchronize the local state with the remote state.
+    @staticmethod
+    def _bulk_update(cukes, concurrency=None):
+        """
+        `_update()` many pages, up to `concurrency` at a time, over the shared connection pool.
+
+        Returns a `cuke.batch.PageResult` (cuke, update, error) per page, in order; one page
+        failing doesn't stop the others.
+        """
+        return CukeBatch(cukes, concurrency).update()
+
+    @classmethod
+    def _bulk_open(cls, pages, concurrency=None, **kwargs):
+        """
+        Attach to many existing pages at once: aliases are looked up once per API key, and the
+        pages' state is fetched up to `concurrency` at a time over the shared connection pool.
+
+        Parameters
+        ----------
+        pages : iterable of str or dict
+            Page ids, or dicts of constructor arguments (page_id, page_slug, editor_key, ...).
+        concurrency : int
+            How many pages to fetch at once; defaults to the connection pool size.
+        **kwargs
+            Constructor arguments shared by every page.
+
+        Returns
+        -------
+        (list of Cuke, cuke.batch.OpenReport)
+            A ready Cuke per page, in order, or None where fetching failed or there was no such page
+            (see `report.errors`), and how long it all took.
+        """
+        return open_pages(cls, pages, concurrency, **kwargs)
+
+    def _sync(self, on_conflict="local"):
+        """
+        Synchronize the local state with the remote state: merge in what changed on the server since
+        the last fetch, send what changed here, and merge in whatever the server changed in response.
+        See `cuke.sync`.
 
         >>> cuke = Cuke()
         >>> cuke.who = "me"
         >>> cuke._template = "hello, {{ who }}"
         >>> cuke._sync()
 
+        Parameters
+        ----------
+        on_conflict : str
+            For keys changed both here and on the server: "local" keeps and sends the local value,
+            "remote" takes the server's.
+
+        Returns
+        -------
+        cuke.sync.SyncResult
+        """
+        changed, conflicts = [], {}
+        pulled = self._pull(on_conflict, changed, conflicts)
+        update = self._update()
+        if update or not pulled:
+            self._pull(on_conflict, changed, conflicts)
+        return SyncResult(self._revision, changed, conflicts, update)
+
+    def _pull(self, on_conflict, changed, conflicts):
+        """Merge in the server's changes, adding to `changed` and `conflicts`; False if there's no page yet."""
+        if not self._page_id or self._page_slug is None:
+            return False
+        with self._flush_lock:
+            resp = make_request_in_api_key_order(self._http.get, self, self._sync_url(),
+                                                 anonymous_error_msg=RETRIEVE_ANONYMOUS_ERROR_MSG)
+            if resp.status_code == 404:
+                return False
+            resp.raise_for_status()
+            self._merge_remote(resp.json(), on_conflict, changed, conflicts)
+        return True
+
+    def _sync_url(self):
+        """/retrieve for what changed since the revision last seen, or everything if there isn't one."""
+        if self._revision is None:
+            return self._url_for("retrieve")
+        return f"{self._url_for('retrieve')}?{urlencode({'since': self._revision})}"
+
+    def _merge_remote(self, resp, on_conflict, changed, conflicts):
+        """
+        Merge a /retrieve response, incremental (with "__changed__") or not, into the local state
+        without overwriting what's dirty. Adds the keys taken from the server to `changed`, and the
+        conflicting ones to `conflicts`.
         """
-        self._update()
-        self._initialize_vars()
+        if on_conflict not in ("local", "remote"):
+            raise ValueError(f"on_conflict must be 'local' or 'remote', not {on_conflict!r}")
+        revision = resp.pop("__revision__", None)
+        fields = {field: resp.pop(field) for field in PAGE_FIELDS if field in resp}
+        manifest = resp.pop("__manifest__", False)
+        entries = resp.pop("__changed__", resp)
+        deleted = resp.pop("__deleted__", [])
+
+        with self._vars_lock:
+            dirty = set(self._dirty_set)
+        take = {}
+        for field, value in fields.items():
+            attr = PAGE_FIELDS[field]
+            local = getattr(self, attr, None)
+            if local == value:
+                continue
+            if attr in dirty:
+                conflicts[attr] = value
+                if on_conflict == "local":
+                    continue
+            take[field] = value
+            if local is not None and attr not in changed:  # None: never fetched, so not a change
+                changed.append(attr)
+        if take:
+            with self._not_sending():
+                self._apply_page_fields(take)
+            with self._vars_lock:
+                self._dirty_set -= {a for a in self._dirty_set - dirty if a.startswith("_")}
+                self._dirty_set -= {PAGE_FIELDS[field] for field in take}
+
+        for k, entry in entries.items():
+            if not manifest and self._digests.get(k) == self._entry_digest(entry):
+                continue  # what this object last stored, or already has
+            with self._vars_lock:
+                if k in self._dirty_set:
+                    conflicts[k] = Series._from_entry(entry) if entry["type"] == "series" else entry.get("value")
+                    if on_conflict == "local":
+                        continue
+                    self._dirty_set.discard(k)
+                if manifest and "value" not in entry:  # for a lazy_keys page
+                    self._vars.pop(k, None)
+                    self._unloaded[k] = entry
+                else:
+                    self._unloaded.pop(k, None)
+                    self._apply_entry(k, entry)
+            if k not in changed:
+                changed.append(k)
+        for k in deleted:
+            with self._vars_lock:
+                if k in self._dirty_set:
+                    conflicts[k] = None
+                    if on_conflict == "local":
+                        continue
+                    self._dirty_set.discard(k)
+                self._vars.pop(k, None)
+                self._unloaded.pop(k, None)
+                self._digests.pop(k, None)
+                self._file_stats.pop(k, None)
+                self._acked.pop(k, None)
+            if k not in changed:
+                changed.append(k)
+        self._revision = revision
 
 
     def _update(self, initial=False):
         """
         Update the remote state with the local state.
+
+        The dirty keys are snapshotted and cleared under `_vars_lock`, then serialized and sent without
+        holding it, so other threads can keep assigning while the request is in flight. If sending
+        fails the snapshotted keys are marked dirty again.
         """
-        requires_storing = {"_template", "_frame_time", "_packages", 
-                            "_ui_thread_js_for_loop_output", "_ui_thread_js_for_loop_input",
-                            "_webworker", "_setup", "_loop", "_event"}
-        basic_updates = {}
-        if any(x in self._dirty_set for x in requires_storing):
-            basic_updates.update(self.__store_template(self._template))
+        self._render_figures(self._dirty_values())  # start rendering before waiting for other flushes
+        with self._flush_lock:
+            if self._state_pending:
+                self._load_pending_state()
+            basic_updates = {}
+            if self._needs_template_store():
+                taken = self._take_template_keys()
+                with self._restoring_dirty_on_error(taken):
+                    basic_updates.update(self.__store_template(self._template))
+                basic_updates.update(taken)
+            if not len(self._dirty_set):
+                return basic_updates or False
+            snapshot = self._take_snapshot(initial)
+            with self._restoring_dirty_on_error(snapshot["keys"]):
+                update = self._build_update(snapshot)
+                if self._is_empty_update(update):
+                    return False
+                self._upload_chunks(snapshot)
+                resp = self._post_store(self._encode_update(update, snapshot))
+                if resp.status_code == 409 and self._recoverable_conflict(resp, update):
+                    # The server's copy of some incrementally sent values isn't the one we built
+                    # on, or it no longer has some chunks.
+                    update = self._full_update(update, snapshot)
+                    self._upload_chunks(snapshot)
+                    resp = self._post_store(self._encode_update(update, snapshot))
+                if resp.status_code == 404:
+                    raise NoPageYet()
+                resp.raise_for_status()
+            self._commit_snapshot(snapshot, update)
+            
+            return False if not len(update) else update
+
+    def _needs_template_store(self):
+        return any(x in self._dirty_set for x in REQUIRES_STORING)
+
+    def _take_template_keys(self):
+        """Clear the template/code keys from the dirty set, returning their values."""
+        with self._vars_lock:
+            taken = {}
             for key in self._dirty_set:
-                if key in requires_storing:
-                    basic_updates[key] = getattr(self, key)
-            [self._dirty_set.remove(x) for x in requires_storing if x in self._dirty_set]
-        if not len(self._dirty_set):
-            return basic_updates or False
+                if key in REQUIRES_STORING:
+                    taken[key] = getattr(self, key)
+            [self._dirty_set.remove(x) for x in REQUIRES_STORING if x in self._dirty_set]
+        return taken
+
+    def _take_snapshot(self, initial=False):
+        """
+        Swap out the dirty set, returning the keys it held plus the current values of the dirty
+        (or, if `initial`, all) variables and page metadata.
+        """
         if not self._page_slug or not self._page_id:
             raise NoPageYet()
-        
-        update = {"__meta__": {}}
-        for key in ("_private", "_basic_auth", "_title"):
-            if key in self._dirty_set:
-                update["__meta__"][key] = getattr(self, key)
-                self._dirty_set.remove(key)
-
-        if initial:
-            keys_to_update = self._vars
+        with self._vars_lock:
+            keys, self._dirty_set = self._dirty_set, set()
+            meta = {key: getattr(self, key) for key in META_KEYS if key in keys}
+            names = self._vars if initial else keys
+            values = {k: self._vars[k] for k in names if k in self._vars}
+        return {"keys": keys, "meta": meta, "vars": values, "initial": initial}
+
+    def _post_store(self, body):
+        return self._post_body(self._url_for("store"), body, self._store_headers(body))
+
+    def _post_body(self, url, body, headers, allow_anonymous=False):
+        """POST `body`, compressed if that's worthwhile, and uncompressed again if the server refuses it."""
+        data, encoding_headers = self._compressed(body)
+        resp = make_request_in_api_key_order(self._http.post, self, url, data=data, allow_anonymous=allow_anonymous,
+                                             additional_headers={**headers, **encoding_headers})
+        if resp.status_code == 415 and encoding_headers:
+            compress.mark_unsupported(self._url)
+            resp = make_request_in_api_key_order(self._http.post, self, url, data=body,
+                                                 allow_anonymous=allow_anonymous, additional_headers=headers)
+        return resp
+
+    def _compressed(self, body):
+        """
+        `body` and the headers to add for it: compressed, once per distinct body, if it's JSON of at
+        least the threshold size and the server accepts compressed bodies.
+        """
+        if (self._compression is None or not isinstance(body, bytes) or len(body) < self._compression_threshold
+                or not compress.is_supported(self._url)):
+            return body, {}
+        key = digest(body)
+        if self._last_compressed is None or self._last_compressed[0] != key:
+            self._last_compressed = (key, compress.compress(body, self._compression, self._compression_level))
+        return self._last_compressed[1], {"Content-Encoding": self._compression}
+
+    def _commit_snapshot(self, snapshot, update):
+        """Record what the server now has, after a snapshot was stored successfully."""
+        self._digests.update(snapshot.get("digests", {}))
+        file_stats = snapshot.get("file_stats", {})
+        for k in update:
+            if k in file_stats:
+                self._file_stats[k] = file_stats[k]
+            else:
+                self._file_stats.pop(k, None)
+        if self._delta_updates:
+            acked = snapshot.get("acked", {})
+            for k in update:
+                if k in acked:
+                    self._acked[k] = acked[k]
+                else:
+                    self._acked.pop(k, None)
+        series = snapshot.get("series", {})
+        for k in update:
+            if k in series:
+                self._series_acked[k] = series[k]
+            elif k != "__meta__":
+                self._series_acked.pop(k, None)
+
+    @contextlib.contextmanager
+    def _restoring_dirty_on_error(self, keys):
+        """Mark `keys` dirty again if the block raises, so a failed send isn't lost."""
+        try:
+            yield
+        except BaseException:
+            with self._vars_lock:
+                self._dirty_set |= set(keys)
+            raise
+
+    def _store_headers(self, body=None):
+        if isinstance(body, encoding.MultipartBody):
+            headers = {"Content-Type": body.content_type, "Content-Length": str(len(body))}
         else:
-            keys_to_update = self._dirty_set
-        for k in keys_to_update:
+            headers = {"Content-Type": "application/json"}
+        if os.environ.get("CUKE_PIPELINE_STAGE", None):
+            headers["X-Cuke-Pipeline-Stage"] = os.environ["CUKE_PIPELINE_STAGE"]
+        return headers
+
+    def _build_update(self, snapshot):
+        """
+        The entries of a /store request for a snapshot taken by `_take_snapshot`.
+
+        Each value is encoded exactly once, into `snapshot["values"]`; the encoded entries, in
+        `snapshot["encoded"]`, are what `_encode_update` stitches into the request body. With
+        `binary_uploads`, bytes-like values go in `snapshot["parts"]` instead, and their entries
+        carry `"part": name` in place of a base64 "value", numbered so no name is the JSON part's.
+        """
+        update = {"__meta__": dict(snapshot["meta"])}
+        values = snapshot["values"] = {}
+        encoded = snapshot["encoded"] = {}
+        figures = self._render_figures(snapshot["vars"])
+        for k, v in snapshot["vars"].items():
+            if isinstance(v, Series):
+                update[k] = self._series_entry(k, v, snapshot)
+                encoded[k] = encoding.dumps(update[k])
+                continue
+            if self._unchanged_file(k, v, snapshot):
+                continue
+            serializer = serializer_for(type(v))
             try:
-                json.dumps(self._vars[k])
-                update[k] = {"type": "basic", "value": self._vars[k]}
-            except Exception as e:
-                if k not in self._vars:
-                    continue
-                elif str(type(self._vars[k])) == "<class 'matplotlib.figure.Figure'>":
-                    buf = io.BytesIO()
-                    self._vars[k].savefig(buf, format="png")
-                    update[k] = {"type": "png_b64", "value": base64.b64encode(buf.getvalue()).decode() }
-                elif str(type(self._vars[k])) == "<class 'function'>":
-                    update[k] = {"type": "function", "value": get_function_body(self._vars[k]) }
-                elif str(type(self._vars[k])) == "<class 'cuke.types.Image'>":
-                    update[k] = {"type": "png_b64", "value": base64.b64encode(self._vars[k].data).decode() }
+                if serializer is None and k not in figures:
+                    values[k] = encoding.dumps(v)
+                    update[k] = {"type": "basic", "value": v}
                 else:
-                    update[k] = {"type": "error", "value": f"Could not serialize. {e}" }
-        # TODO this needs error handling or it kills the thread
-        if os.environ.get("CUKE_PIPELINE_STAGE", None):
-            headers = {"X-Cuke-Pipeline-Stage": os.environ["CUKE_PIPELINE_STAGE"]}
-        else:
-            headers = {}
+                    update[k] = dict(figures[k].result()) if k in figures else serializer(v)
+                    if isinstance(update[k]["value"], (bytes, bytearray, memoryview, encoding.FileStream)):
+                        if self._binary_uploads or self._is_chunked(update[k]["value"]):
+                            parts = snapshot.setdefault("parts", {})
+                            parts[k] = update[k].pop("value")
+                            update[k]["part"] = f"part{len(parts)}"
+                            encoded[k] = encoding.dumps(update[k])
+                            continue
+                        if isinstance(update[k]["value"], encoding.FileStream):
+                            update[k]["value"] = update[k]["value"].read()
+                        update[k]["value"] = base64.b64encode(update[k]["value"]).decode()
+                    values[k] = encoding.dumps(update[k]["value"])
+            except Exception as e:
+                update[k] = {"type": "error", "value": f"Could not serialize. {e}" }
+                values[k] = encoding.dumps(update[k]["value"])
+            encoded[k] = encoding.entry_bytes(update[k], values[k])
+        self._drop_unchanged(update, snapshot)
+        if self._delta_updates:
+            self._encode_deltas(update, snapshot)
+        if self._chunk_threshold is not None:
+            self._chunk_large_values(update, snapshot)
+        return update
+
+    def _is_chunked(self, payload):
+        return self._chunk_threshold is not None and chunks.size(payload) > self._chunk_threshold
+
+    def _chunk_large_values(self, update, snapshot):
+        """Replace the payloads over the chunk threshold with the hashes of their chunks."""
+        to_upload = snapshot["chunks"] = {}  # hash -> (source, offset, length)
+        parts = snapshot.get("parts", {})
+        for k, entry in list(update.items()):
+            if k in parts and self._is_chunked(parts[k]):
+                source = parts.pop(k)
+                entry = {name: v for name, v in entry.items() if name != "part"}
+            elif entry.get("type") == "basic" and "value" in entry and self._is_chunked(snapshot["values"][k]):
+                source = snapshot["values"][k]
+                entry = {name: v for name, v in entry.items() if name != "value"}
+                entry["json"] = True
+            else:
+                continue
+            split = chunks.split(source, self._chunk_size)
+            for h, offset, length in split:
+                to_upload[h] = (source, offset, length)
+            update[k] = {**entry, "chunks": [h for h, _, _ in split], "size": chunks.size(source)}
+            snapshot["encoded"][k] = encoding.dumps(update[k])
+
+    def _unknown_chunks(self, snapshot):
+        """The chunks of `snapshot` the server isn't known to have: hash -> (source, offset, length)."""
+        return {h: where for h, where in snapshot.get("chunks", {}).items() if not chunks.is_known(self._url, h)}
+
+    def _chunk_batches(self, unknown):
+        hashes = list(unknown)
+        return [hashes[i:i + chunks.EXISTENCE_BATCH_SIZE] for i in range(0, len(hashes), chunks.EXISTENCE_BATCH_SIZE)]
+
+    def _note_missing(self, batch, resp):
+        """Remember the chunks of `batch` the server already has; returns the ones it lacks."""
+        resp.raise_for_status()
+        missing = set(resp.json()["missing"])
+        chunks.remember(self._url, [h for h in batch if h not in missing])
+        return missing
+
+    def _missing_chunks(self, snapshot):
+        """Ask the server which of the unknown chunks of `snapshot` it lacks."""
+        unknown = self._unknown_chunks(snapshot)
+        missing = set()
+        for batch in self._chunk_batches(unknown):
+            resp = make_request_in_api_key_order(self._http.post, self, f"{self._url}/chunks", json={"hashes": batch})
+            missing |= self._note_missing(batch, resp)
+        return {h: where for h, where in unknown.items() if h in missing}
+
+    def _upload_chunk(self, h, where):
+        body = chunks.ChunkBody(chunks.read(*where))
+        resp = make_request_in_api_key_order(self._http.post, self, f"{self._url}/chunk/{h}", data=body,
+                                             additional_headers=self._chunk_headers(body))
+        resp.raise_for_status()
+        chunks.remember(self._url, [h])
+
+    @staticmethod
+    def _chunk_headers(body):
+        return {"Content-Type": "application/octet-stream", "Content-Length": str(len(body))}
+
+    def _upload_chunks(self, snapshot):
+        """
+        Upload the chunks of `snapshot` the server doesn't have yet, in parallel. If any fail, the
+        rest still finish, so a retry only has to send the failed ones.
+        """
+        missing = self._missing_chunks(snapshot)
+        if not missing:
+            return
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(min(len(missing), cuke_session.default_pool_size())) as pool:
+            futures = [pool.submit(self._upload_chunk, h, where) for h, where in missing.items()]
+        for future in futures:
+            future.result()
+
+    def _unchanged_file(self, k, v, snapshot):
+        """
+        Whether `v` is an Image of a file whose inode, size and mtime are what the server last
+        acknowledged for `k`, so it needn't even be read. Otherwise its stat is noted in the snapshot.
+        """
+        if snapshot["initial"] or not isinstance(v, Image) or v._data is not None:
+            return False  # in-memory data is what's sent, whatever the file at `path` is like
         try:
-            qwe = self.__url_for("store")
-            resp = make_request_in_api_key_order(requests.post, self, self.__url_for("store"), json=update, additional_headers=headers)
-            resp.raise_for_status()
-        except HTTPError as e:
-            if resp.status_code == 404:
-                raise NoPageYet()
+            stat = v.stat()
+        except OSError:
+            return False  # let the serializer report it
+        if stat is None:
+            return False
+        file_digest = digest(repr((v.path, stat)).encode())
+        if self._file_stats.get(k) == file_digest:
+            self._bytes_saved += stat[1]
+            return True
+        snapshot.setdefault("file_stats", {})[k] = file_digest
+        return False
+
+    def _dirty_values(self):
+        with self._vars_lock:
+            return {k: self._vars[k] for k in self._dirty_set if k in self._vars}
+
+    def _render_figures(self, values):
+        """Start rendering the figures among `values` with their keys' options; key -> future entry."""
+        return {k: render.render(v, **self._figure_options.get(k, {}))
+                for k, v in values.items() if render.is_figure(v)}
+
+    def _encode_deltas(self, update, snapshot):
+        """
+        Give each JSON value a version number, and send it as a patch against the version the server
+        last acknowledged instead, when the patch is smaller.
+        """
+        acked = snapshot["acked"] = {}
+        for k, entry in list(update.items()):
+            if k == "__meta__" or entry["type"] != "basic":
+                continue
+            value_bytes = snapshot["values"][k]
+            value = encoding.loads(value_bytes)  # our own copy, safe from later in-place changes
+            version = self._acked[k][0] + 1 if k in self._acked else 1
+            acked[k] = (version, value)
+            update[k] = {"type": "basic", "value": entry["value"], "version": version}
+            snapshot["encoded"][k] = encoding.entry_bytes(update[k], value_bytes)
+            if k in self._acked:
+                base_version, base = self._acked[k]
+                delta = {"type": "delta", "base": base_version, "version": version, "patch": diff(base, value)}
+                delta_bytes = encoding.dumps(delta)
+                if len(delta_bytes) < len(value_bytes):
+                    update[k] = delta
+                    snapshot["encoded"][k] = delta_bytes
+
+    def _series_entry(self, k, series, snapshot):
+        """Only the points appended since the server's last acknowledged one, if it has the rest."""
+        series_id, end = self._series_acked.get(k, (None, None))
+        entry, end = series._entry(since=end if series_id == series.id else None)
+        snapshot.setdefault("series", {})[k] = (series.id, end)
+        return entry
+
+    @staticmethod
+    def _has_increments(update):
+        return any(entry.get("type") in ("delta", "series_append") for entry in update.values())
+
+    def _recoverable_conflict(self, resp, update):
+        """Whether resending in full, after uploading any chunks the server says it lacks, could fix a 409."""
+        try:
+            missing = resp.json().get("missing_chunks")
+        except ValueError:
+            missing = None
+        if missing:
+            chunks.forget(self._url, set(missing))
+        return bool(missing) or self._has_increments(update)
+
+    def _full_update(self, update, snapshot):
+        """`update` with each delta or series append replaced by the whole value."""
+        full = {}
+        encoded = snapshot["encoded"]
+        for k, entry in update.items():
+            if entry.get("type") == "delta":
+                full[k] = {"type": "basic", "value": snapshot["vars"][k], "version": entry["version"]}
+                encoded[k] = encoding.entry_bytes(full[k], snapshot["values"][k])
+            elif entry.get("type") == "series_append":
+                full[k], end = snapshot["vars"][k]._entry()
+                snapshot["series"][k] = (entry["id"], end)
+                encoded[k] = encoding.dumps(full[k])
             else:
-                raise e
-        self._dirty_set = set()
-        
-        return False if not len(update) else update
+                full[k] = entry
+        return full
+
+    @staticmethod
+    def _encode_update(update, snapshot):
+        """
+        The request body for `update`, from the entries already encoded by `_build_update`: JSON, or
+        multipart if any entry refers to a binary part.
+        """
+        fragments = {"__meta__": encoding.dumps(update["__meta__"])}
+        for k in update:
+            if k != "__meta__":
+                fragments[k] = snapshot["encoded"][k]
+        body = encoding.object_bytes(fragments)
+        parts = {update[k]["part"]: data for k, data in snapshot.get("parts", {}).items() if k in update}
+        return encoding.MultipartBody(body, parts) if parts else body
+
+    def _drop_unchanged(self, update, snapshot):
+        """
+        With `dedupe`, leave out values that are what the server last acknowledged for that key. Either
+        way, note the digests of what's sent, as the server will store it, so `_sync` can tell its own
+        writes apart.
+        """
+        drop = self._dedupe and not snapshot["initial"]
+        digests = snapshot["digests"] = {}
+        parts = snapshot.get("parts", {})
+        for k in list(update):
+            if k == "__meta__":
+                continue
+            if k in parts:
+                value_digest = self._part_digest(update[k], parts[k])
+                size = len(snapshot["encoded"][k]) + chunks.size(parts[k])
+            else:
+                encoded = snapshot["encoded"][k]
+                value_digest = digest(encoded) if "value" in update[k] else self._entry_digest(update[k])
+                size = len(encoded)
+            if drop and self._digests.get(k) == value_digest:
+                del update[k]
+                self._bytes_saved += size
+            else:
+                digests[k] = value_digest
+
+    @staticmethod
+    def _is_empty_update(update):
+        return len(update) == 1 and not update["__meta__"]
 
 
     def _start(self, update_interval=1.5):
         """
-        Start a background thread to send updates at an interval (specified in seconds).
+        Start a background thread that sends updates as soon as variables change, but at most once
+        per `update_interval` seconds. Failed sends are retried with backoff.
 
         Parameters
         ----------
         update_interval : float
-            How often to send updates, in seconds.
+            Minimum time between sends, in seconds.
         
         Returns
         -------
         None
         """
         assert not self._instant_updates, "You don't need a background thread if instant updates are on."
-        def task(self_):
-            while self_._run_thread and self_._main_thread.is_alive():
-                if len(self._dirty_set):
-                    with self_._vars_lock:
-                        self_._update()
-                time.sleep(update_interval)
-        self._run_thread = True
-        self._main_thread = threading.current_thread()
-        self._daemon = threading.Thread(target=task, args=(weakref.proxy(self), ), daemon=True, name="updater")
-        self._daemon.start()
+        if self._updater is not None:
+            self._updater.stop(flush=False)
+        self._updater = Updater(self, min_interval=update_interval)
+        self._updater.start()
+        if len(self._dirty_set):
+            self._updater.notify(len(self._dirty_set))
 
 
     @property
     def _is_running(self):
-        if self._daemon is None:
+        if self._updater is None:
             return False
-        return self._daemon.is_alive()
+        return self._updater.is_running
+
+
+    @property
+    def _updater_status(self):
+        """Dirty keys waiting to be sent, the last send error, and when the last send succeeded."""
+        updater = self._updater
+        return {"queue_depth": len(self._dirty_set),
+                "last_error": updater.last_error if updater else None,
+                "last_success": updater.last_success if updater else None,
+                "failures": updater.failures if updater else 0}
 
 
-    def _stop(self):
-        self._run_thread = False
-        if self._daemon is not None:
-            self._daemon.join()
+    def _stop(self, flush=True):
+        """Stop the background updater, first sending whatever is still dirty if `flush`."""
+        if self._updater is not None:
+            self._updater.stop(flush=flush)
 
 
     def __del__(self):
-        self._stop()
+        self._stop(flush=False)
 
 
     def __store_template(self, template):
@@ -292,6 +1082,16 @@ class Cuke:
         Store a template. If basic_auth is provided - a dict with keys username and password - that will set the page up with
         HTTP basic auth.
         """
+        resp = self._post_body(f"{self._url}/store_template", encoding.dumps(self._template_payload(template)),
+                               {"Content-Type": "application/json"}, allow_anonymous=True)
+
+        resp.raise_for_status()
+
+        return self._apply_template_response(template, resp.json())
+
+    def _template_payload(self, template):
+        """The body of a /store_template request."""
+        import inspect
         if self._page_id is None and self._api_key is not None:
             raise SetPageIdOnInitialization()
         username = self._basic_auth.get("username", None)
@@ -314,17 +1114,13 @@ class Cuke:
         if self._event:
             code["event"] = inspect.getsource(self._event).strip()
         code["packages"] = self._packages
-        
-        resp = make_request_in_api_key_order(requests.post, self, f"{self._url}/store_template",
-                                             json={"template": template, "username": username,
-                                                   "page_subslug": self._page_subslug, "page_id": page_id, 
-                                                   "password": password, "code": code}, allow_anonymous=True)
-
-        resp.raise_for_status()
+        return {"template": template, "username": username, "page_subslug": self._page_subslug,
+                "page_id": page_id, "password": password, "code": code}
 
-        self._template = template
+    def _apply_template_response(self, template, response):
+        if self._template != template:
+            self._template = template
 
-        response = resp.json()
         url = response["url"]
         if not self._api_key:
             #_, _, self._page_slug, self._page_id = url.split("/")
@@ -336,7 +1132,7 @@ class Cuke:
             self._page_subslug = response["page_subslug"]
         if not self._page_slug:
             self._page_slug = response["page_slug"]
-        self._contributor_key = resp.json()["contributor_key"]
-        self._editor_key = resp.json()["editor_key"]
+        self._contributor_key = response["contributor_key"]
+        self._editor_key = response["editor_key"]
         
-        return resp.json()
\ No newline at end of file
+        return response
\ No newline at end of file
@@ -0,0 +1,476 @@
+"""
+Asyncio-native Cuke client.
+
+>>> cuke = await AsyncCuke.create(url="https://cuke.cool", page_id="...", editor_key="...")
+>>> cuke.x = 1
+>>> await cuke._update()
+
+Attribute assignment and dirty tracking work exactly as on Cuke; everything that talks to the
+server is a coroutine. Requests go through one pooled httpx.AsyncClient per server and event loop,
+so many pages can be driven concurrently from a single loop. Needs httpx (`pip install cuke[async]`).
+"""
+import asyncio
+import time
+import weakref
+
+from cuke import RETRIEVE_ANONYMOUS_ERROR_MSG, Cuke, aliases, chunks, compress, encoding, remote
+from cuke import session as cuke_session
+from cuke.batch import OpenReport, PageResult, alias_lookups, concurrency_for, detached_pages
+from cuke.errors import AliasNotFetched, KeyNotLoaded, NoPageYet, PageNotFound
+from cuke.sync import SyncResult
+from cuke.updater import backoff_delay
+from cuke.util import headers_in_api_key_order
+
+_clients = weakref.WeakKeyDictionary()  # event loop -> {base url: httpx.AsyncClient}
+
+
+def _httpx():
+    try:
+        import httpx
+    except ImportError:
+        raise ImportError("AsyncCuke needs httpx. Install it with `pip install cuke[async]`.") from None
+    return httpx
+
+
+def _timeout(timeout):
+    """Convert a requests-style timeout, maybe a (connect, read) tuple, to an httpx one."""
+    httpx = _httpx()
+    if isinstance(timeout, tuple):
+        connect, read = timeout
+        return httpx.Timeout(read, connect=connect)
+    return httpx.Timeout(timeout)
+
+
+def get_async_client(url):
+    """The shared client for the server at `url` on the running event loop, creating it on first use."""
+    clients = _clients.setdefault(asyncio.get_running_loop(), {})
+    key = cuke_session.base_url(url)
+    if key not in clients:
+        httpx = _httpx()
+        pool_size = cuke_session.default_pool_size()
+        limits = httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+        clients[key] = httpx.AsyncClient(limits=limits)
+    return clients[key]
+
+
+def set_async_client(url, client):
+    """Use `client` for every AsyncCuke on the running event loop talking to the server at `url`."""
+    _clients.setdefault(asyncio.get_running_loop(), {})[cuke_session.base_url(url)] = client
+
+
+async def close_async_clients():
+    """Close and forget the pooled clients of the running event loop."""
+    clients = _clients.pop(asyncio.get_running_loop(), {})
+    for client in clients.values():
+        await client.aclose()
+
+
+async def make_async_request_in_api_key_order(method, cls, url, json=None, allow_anonymous=False,
+                                              anonymous_error_msg="", additional_headers=None, content=None):
+    headers = headers_in_api_key_order(cls, allow_anonymous, anonymous_error_msg, additional_headers)
+    return await cls._http.request(method, url, json=json, content=content, headers=_without_none(headers),
+                                   timeout=_timeout(cls._request_timeout))
+
+
+def _without_none(headers):
+    return {k: v for k, v in headers.items() if v is not None}
+
+
+class AsyncUpdater:
+    """
+    `cuke.updater.Updater` for AsyncCuke: a task on the event loop that waits on an asyncio.Event,
+    set when a key becomes dirty, rather than a thread. Same spacing, backoff and status attributes.
+    """
+    def __init__(self, cuke, min_interval=0.0, backoff_base=0.5, backoff_max=60.0):
+        self._cuke = weakref.ref(cuke)
+        self.min_interval = min_interval
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.last_error = None
+        self.last_success = None  # time.time() of the last successful send
+        self.failures = 0  # consecutive failed sends
+        self._event = None  # created in start(), inside the event loop
+        self._not_before = 0.0  # earliest loop time the next send may start
+        self._task = None
+
+    @property
+    def is_running(self):
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        if not self.is_running:
+            self._event = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def notify(self, n_dirty):
+        if self._event is not None:
+            self._event.set()
+
+    def stop(self, flush=True):
+        """Cancel the task and, if `flush`, schedule a last update of whatever is still dirty."""
+        if self.is_running:
+            try:
+                self._task.cancel()
+            except RuntimeError:
+                pass  # its event loop is closed
+        self._event = None
+        cuke = self._cuke()
+        if flush and cuke is not None and len(cuke._dirty_set):
+            cuke._schedule_update()
+        return True
+
+    async def _send(self, cuke):
+        try:
+            await cuke._update()
+        except Exception as e:
+            self.failures += 1
+            self.last_error = e
+            return False
+        self.failures = 0
+        self.last_success = time.time()
+        return True
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        event = self._event
+        while True:
+            await event.wait()
+            delay = self._not_before - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            event.clear()
+            cuke = self._cuke()
+            if cuke is None:
+                return
+            started = loop.time()
+            ok = await self._send(cuke)
+            del cuke
+            if ok:
+                self._not_before = started + self.min_interval
+            else:
+                # The keys are dirty again; retry them once the backoff has passed.
+                self._not_before = loop.time() + backoff_delay(self.failures, self.backoff_base, self.backoff_max)
+                event.set()
+
+
+class AsyncCuke(Cuke):
+    """
+    Cuke for asyncio code. The constructor does no I/O; `await AsyncCuke.create(...)` takes the same
+    arguments and also looks up your alias and fetches an existing page, like Cuke() does.
+    """
+    _connect_on_init = False
+
+    def __init__(self, *args, coalesce_latency=None, coalesce_batch_size=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._coalesce = None
+        if coalesce_latency is not None or coalesce_batch_size is not None:
+            self._coalesce = (coalesce_latency or 0.05, coalesce_batch_size)
+        self._coalesce_handle = None
+        self._pending_updates = set()
+        self._update_lock = None  # created on first use, inside the event loop
+
+    @classmethod
+    async def create(cls, *args, **kwargs):
+        cuke = cls(*args, **kwargs)
+        if (cuke._alias_pending or cuke._slug is None) and cuke._api_key is not None:
+            cuke._page_slug = await cuke._fetch_user_alias()
+        if cuke._page_id:
+            await cuke._initialize_vars()
+        cuke._dirty_set = set()
+        return cuke
+
+    @property
+    def _http(self):
+        return self._session or get_async_client(self._url)
+
+    @property
+    def _user_alias(self):
+        """The cached alias of the API key; looking it up can't wait for the network here."""
+        if self._api_key is None:
+            return None
+        alias = aliases.get(self._url, self._api_key)
+        if alias is None:
+            raise AliasNotFetched()
+        return alias
+
+    async def _fetch_user_alias(self):
+        alias = aliases.get(self._url, self._api_key)
+        if alias is None:
+            resp = await self._http.get(f"{self._url}/user/get_alias",
+                                        headers=_without_none(self._headers(self._api_key)),
+                                        timeout=_timeout(self._request_timeout))
+            resp.raise_for_status()
+            alias = resp.json()["alias"]
+            aliases.put(self._url, self._api_key, alias)
+        return alias
+
+    async def _call_remote(self, key, *args, **kwargs):
+        """Remote version of function with name `key`, called with `args` and `kwargs` if there are any."""
+        cache_key, cached = self._cached_result(key, args, kwargs)
+        if cached is not None and cached[2]:
+            return cached[0]
+        body = remote.call_body(args, kwargs)
+        headers = _without_none(self._remote_headers(cached))
+        if body is None:
+            resp = await self._http.get(self._execute_url(key), headers=headers, timeout=_timeout(self._request_timeout))
+        else:
+            resp = await self._http.post(self._execute_url(key), content=encoding.dumps(body),
+                                         headers={**headers, "Content-Type": "application/json"},
+                                         timeout=_timeout(self._request_timeout))
+        return self._remote_result(resp, cache_key, cached)
+
+    class _CukeFun(Cuke._CukeFun):
+        """Function to be executed remotely; calling it returns a coroutine."""
+        def submit(self, *args, **kwargs):
+            """Start the call as an asyncio Task."""
+            return asyncio.ensure_future(self(*args, **kwargs))
+
+        async def map(self, iterable, concurrency=None, ordered=True):
+            """Like `Cuke._CukeFun.map`, as an async generator."""
+            concurrency = concurrency or cuke_session.default_pool_size()
+            pending = []
+            for item in iterable:
+                pending.append((item, self.submit(item)))
+                while len(pending) >= concurrency:
+                    async for result in self._finished(pending, ordered):
+                        yield result
+            while pending:
+                async for result in self._finished(pending, ordered):
+                    yield result
+
+        @staticmethod
+        async def _finished(pending, ordered):
+            """Wait for the first of `pending`, or any of them if not `ordered`, and yield what's done."""
+            if ordered:
+                item, task = pending.pop(0)
+                yield await task
+                return
+            ready, _ = await asyncio.wait([t for _, t in pending], return_when=asyncio.FIRST_COMPLETED)
+            for item, task in [p for p in pending if p[1] in ready]:
+                pending.remove((item, task))
+                yield item, task.result()
+
+    async def _initialize_vars(self):
+        cached = self._cached_state()
+        resp = await make_async_request_in_api_key_order("GET", self, self._retrieve_url(),
+                                                         anonymous_error_msg=RETRIEVE_ANONYMOUS_ERROR_MSG,
+                                                         additional_headers=self._revalidation_headers(cached))
+        if resp.status_code == 404:
+            return False
+        self._apply_retrieved(self._retrieved_state(resp, cached))
+
+    async def _prefetch(self, *keys):
+        """Fetch the values of `keys` that a page loaded with `lazy_keys=True` hasn't yet, in one request."""
+        keys = [k for k in keys if k in self._unloaded]
+        if not keys:
+            return
+        resp = await make_async_request_in_api_key_order("GET", self, self._retrieve_url(keys),
+                                                         anonymous_error_msg=RETRIEVE_ANONYMOUS_ERROR_MSG)
+        resp.raise_for_status()
+        self._apply_fetched(keys, resp.json())
+
+    def _load_on_read(self, key):
+        raise KeyNotLoaded(key)  # reading an attribute can't wait for the network here
+
+    @staticmethod
+    async def _bulk_update(cukes, concurrency=None):
+        """`await _update()` many pages, up to `concurrency` at a time; a PageResult per page, in order."""
+        limit = asyncio.Semaphore(concurrency_for(len(cukes), concurrency))
+
+        async def update(cuke):
+            async with limit:
+                try:
+                    return PageResult(cuke, await cuke._update(), None)
+                except Exception as e:
+                    return PageResult(cuke, None, e)
+
+        return list(await asyncio.gather(*(update(cuke) for cuke in cukes)))
+
+    @classmethod
+    async def _bulk_open(cls, pages, concurrency=None, **kwargs):
+        """Like `Cuke._bulk_open`: a ready AsyncCuke per page (None where fetching failed), and a report."""
+        report = OpenReport()
+        cukes = detached_pages(cls, pages, kwargs)
+        started = time.perf_counter()
+        for group in alias_lookups(cukes):
+            alias = await group[0]._fetch_user_alias()
+            for cuke in group:
+                cuke._page_slug = alias
+        report.alias = time.perf_counter() - started
+        limit = asyncio.Semaphore(concurrency_for(len(cukes), concurrency))
+
+        async def attach(cuke):
+            async with limit:
+                started = time.perf_counter()
+                try:
+                    if cuke._page_id and await cuke._attach() is False:
+                        raise PageNotFound(cuke._page_id)
+                except Exception as e:
+                    report.record(cuke._page_id, started, e)
+                else:
+                    report.record(cuke._page_id, started)
+
+        await asyncio.gather(*(attach(cuke) for cuke in cukes))
+        return report.finish(cukes)
+
+    async def _attach(self):
+        changes = self._local_changes()
+        with self._not_sending():
+            found = await self._initialize_vars()
+        self._restore_local_changes(changes)
+        return found
+
+    async def _sync(self, on_conflict="local"):
+        """Like `Cuke._sync`: merge in the server's changes since the last fetch, then send the local ones."""
+        changed, conflicts = [], {}
+        pulled = await self._pull(on_conflict, changed, conflicts)
+        update = await self._update()
+        if update or not pulled:
+            await self._pull(on_conflict, changed, conflicts)
+        return SyncResult(self._revision, changed, conflicts, update)
+
+    async def _pull(self, on_conflict, changed, conflicts):
+        if not self._page_id or self._page_slug is None:
+            return False
+        if self._update_lock is None:
+            self._update_lock = asyncio.Lock()
+        async with self._update_lock:
+            resp = await make_async_request_in_api_key_order("GET", self, self._sync_url(),
+                                                             anonymous_error_msg=RETRIEVE_ANONYMOUS_ERROR_MSG)
+            if resp.status_code == 404:
+                return False
+            resp.raise_for_status()
+            self._merge_remote(resp.json(), on_conflict, changed, conflicts)
+        return True
+
+    async def _update(self, initial=False):
+        """
+        Update the remote state with the local state.
+        """
+        if self._update_lock is None:
+            self._update_lock = asyncio.Lock()
+        # Let dirty figures render on the pool without blocking the event loop; errors surface in the update.
+        figures = self._render_figures(self._dirty_values())
+        await asyncio.gather(*map(asyncio.wrap_future, figures.values()), return_exceptions=True)
+        async with self._update_lock:
+            basic_updates = {}
+            if self._needs_template_store():
+                taken = self._take_template_keys()
+                with self._restoring_dirty_on_error(taken):
+                    basic_updates.update(await self._store_template(self._template))
+                basic_updates.update(taken)
+            if not len(self._dirty_set):
+                return basic_updates or False
+            snapshot = self._take_snapshot(initial)
+            with self._restoring_dirty_on_error(snapshot["keys"]):
+                update = self._build_update(snapshot)
+                if self._is_empty_update(update):
+                    return False
+                await self._upload_chunks(snapshot)
+                resp = await self._post_store(self._encode_update(update, snapshot))
+                if resp.status_code == 409 and self._recoverable_conflict(resp, update):
+                    update = self._full_update(update, snapshot)
+                    await self._upload_chunks(snapshot)
+                    resp = await self._post_store(self._encode_update(update, snapshot))
+                if resp.status_code == 404:
+                    raise NoPageYet()
+                resp.raise_for_status()
+            self._commit_snapshot(snapshot, update)
+            return False if not len(update) else update
+
+    async def _post_store(self, body):
+        return await self._post_body(self._url_for("store"), body, self._store_headers(body))
+
+    async def _post_body(self, url, body, headers, allow_anonymous=False):
+        data, encoding_headers = self._compressed(body)
+        if isinstance(data, encoding.MultipartBody):
+            data = data.aiter()
+        resp = await make_async_request_in_api_key_order("POST", self, url, content=data, allow_anonymous=allow_anonymous,
+                                                         additional_headers={**headers, **encoding_headers})
+        if resp.status_code == 415 and encoding_headers:
+            compress.mark_unsupported(self._url)
+            resp = await make_async_request_in_api_key_order("POST", self, url, content=body,
+                                                             allow_anonymous=allow_anonymous, additional_headers=headers)
+        return resp
+
+    async def _missing_chunks(self, snapshot):
+        unknown = self._unknown_chunks(snapshot)
+        missing = set()
+        for batch in self._chunk_batches(unknown):
+            resp = await make_async_request_in_api_key_order("POST", self, f"{self._url}/chunks", json={"hashes": batch})
+            missing |= self._note_missing(batch, resp)
+        return {h: where for h, where in unknown.items() if h in missing}
+
+    async def _upload_chunks(self, snapshot):
+        missing = await self._missing_chunks(snapshot)
+        limit = asyncio.Semaphore(cuke_session.default_pool_size())
+
+        async def upload(h, where):
+            body = chunks.ChunkBody(chunks.read(*where))
+            async with limit:
+                resp = await make_async_request_in_api_key_order("POST", self, f"{self._url}/chunk/{h}",
+                                                                 content=body.aiter(),
+                                                                 additional_headers=self._chunk_headers(body))
+            resp.raise_for_status()
+            chunks.remember(self._url, [h])
+
+        results = await asyncio.gather(*(upload(h, where) for h, where in missing.items()), return_exceptions=True)
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+
+    async def _store_template(self, template):
+        resp = await self._post_body(f"{self._url}/store_template", encoding.dumps(self._template_payload(template)),
+                                     {"Content-Type": "application/json"}, allow_anonymous=True)
+        resp.raise_for_status()
+        return self._apply_template_response(template, resp.json())
+
+    def _instant_update(self):
+        if self._coalesce is None:
+            return self._schedule_update()
+        latency, batch_size = self._coalesce
+        if batch_size is not None and len(self._dirty_set) >= batch_size:
+            self._cancel_coalesce()
+            self._schedule_update()
+        elif self._coalesce_handle is None:
+            self._coalesce_handle = asyncio.get_running_loop().call_later(latency, self._coalesced)
+
+    def _coalesced(self):
+        self._coalesce_handle = None
+        self._schedule_update()
+
+    def _cancel_coalesce(self):
+        if self._coalesce_handle is not None:
+            self._coalesce_handle.cancel()
+            self._coalesce_handle = None
+
+    def _schedule_update(self):
+        task = asyncio.get_running_loop().create_task(self._update())
+        self._pending_updates.add(task)
+        task.add_done_callback(self._pending_updates.discard)
+
+    async def _flush(self):
+        """Wait for scheduled instant updates, then send anything still dirty."""
+        self._cancel_coalesce()
+        if self._pending_updates:
+            await asyncio.gather(*self._pending_updates, return_exceptions=True)
+        return await self._update()
+
+    def _start(self, update_interval=1.5):
+        """
+        Start a background task on the running event loop that sends updates as soon as variables
+        change, but at most once per `update_interval` seconds. Failed sends are retried with backoff.
+        """
+        assert not self._instant_updates, "You don't need a background task if instant updates are on."
+        if self._updater is not None:
+            self._updater.stop(flush=False)
+        self._updater = AsyncUpdater(self, min_interval=update_interval)
+        self._updater.start()
+        if len(self._dirty_set):
+            self._updater.notify(len(self._dirty_set))
+
+    def _stop(self, flush=True):
+        """Stop the background task; if `flush`, schedule a last update of whatever is still dirty."""
+        if self._updater is not None:
+            self._updater.stop(flush=flush)
+        self._cancel_coalesce()
@@ -0,0 +1,121 @@
+"""
+A cache of the alias (page slug) belonging to each API key, so constructing a Cuke doesn't cost a
+round trip to /user/get_alias every time.
+
+Aliases are cached in memory for the whole process and, optionally, in a JSON file shared between
+processes (API keys are stored hashed). Entries expire after `ttl` seconds.
+
+>>> import cuke.aliases
+>>> cuke.aliases.configure(ttl=3600, path="~/.cache/cuke/aliases.json")
+>>> cuke.aliases.invalidate()  # e.g. after renaming your account
+
+The file can also be set with the CUKE_ALIAS_CACHE environment variable.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+
+from cuke.session import base_url
+
+DEFAULT_TTL = 24 * 3600
+
+_config = {"ttl": DEFAULT_TTL, "path": None}
+_aliases = {}  # cache key -> (alias, expiry as time.time())
+_lock = threading.Lock()
+
+
+def configure(ttl=None, path=None):
+    """
+    Parameters
+    ----------
+    ttl : float
+        How long an alias stays valid, in seconds.
+    path : str
+        JSON file to keep aliases in between processes. Defaults to $CUKE_ALIAS_CACHE, if set.
+    """
+    if ttl is not None:
+        _config["ttl"] = ttl
+    if path is not None:
+        _config["path"] = path
+
+
+def _path():
+    path = _config["path"] or os.environ.get("CUKE_ALIAS_CACHE")
+    return os.path.expanduser(path) if path else None
+
+
+def _key(url, api_key):
+    return f"{base_url(url)} {hashlib.sha256(api_key.encode()).hexdigest()}"
+
+
+def _read_file(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_file(path, entries):
+    """Replace the file atomically, so concurrent readers never see half of it."""
+    import tempfile
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=".aliases-")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(entries, f)
+        os.replace(tmp, path)
+    except OSError:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+
+
+def get(url, api_key):
+    """The cached alias for `api_key` on the server at `url`, or None."""
+    key = _key(url, api_key)
+    now = time.time()
+    with _lock:
+        alias, expiry = _aliases.get(key, (None, 0))
+        if expiry > now:
+            return alias
+        path = _path()
+        if path is None:
+            return None
+        alias, expiry = _read_file(path).get(key, (None, 0))
+        if expiry > now:
+            _aliases[key] = (alias, expiry)
+            return alias
+    return None
+
+
+def put(url, api_key, alias):
+    key = _key(url, api_key)
+    expiry = time.time() + _config["ttl"]
+    with _lock:
+        _aliases[key] = (alias, expiry)
+        path = _path()
+        if path is not None:
+            now = time.time()
+            entries = {k: v for k, v in _read_file(path).items() if v[1] > now}
+            entries[key] = (alias, expiry)
+            _write_file(path, entries)
+
+
+def invalidate(url=None, api_key=None):
+    """Forget the alias of `api_key` on the server at `url`, or every alias if they're not given."""
+    with _lock:
+        path = _path()
+        entries = _read_file(path) if path is not None else {}
+        if url is None or api_key is None:
+            _aliases.clear()
+            entries = {}
+        else:
+            _aliases.pop(_key(url, api_key), None)
+            entries.pop(_key(url, api_key), None)
+        if path is not None and os.path.exists(path):
+            _write_file(path, entries)
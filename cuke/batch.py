@@ -0,0 +1,141 @@
+"""
+Publishing to, and attaching to, many pages at once.
+
+>>> batch = CukeBatch(cukes, concurrency=32)
+>>> for result in batch.update():
+...     if result.error is not None:
+...         print(result.cuke._page_id, result.error)
+
+Each page's dirty state is sent with its own `_update()`, up to `concurrency` at a time, over the
+shared connection pool (see `cuke.session`), instead of one round trip after another. A page that
+fails keeps its keys dirty, like a failed `_update()` does, and doesn't stop the others.
+
+>>> cukes, report = Cuke._bulk_open(page_ids, api_key=key, concurrency=32)
+>>> report
+OpenReport(pages=2000, failed=0, alias=0.041s, total=3.2s, slowest=0.310s)
+
+`_bulk_open` looks the alias up once per API key rather than once per page, then fetches the pages'
+state concurrently.
+"""
+import time
+from collections import namedtuple
+
+from cuke import session as cuke_session
+from cuke.errors import PageNotFound
+
+PageResult = namedtuple("PageResult", ["cuke", "update", "error"])
+PageResult.__doc__ = "What `_update()` returned for `cuke`, or the exception it raised as `error`."
+
+
+def concurrency_for(n, concurrency=None):
+    """How many of `n` pages to handle at once: `concurrency`, or else the connection pool size."""
+    return max(1, min(n, concurrency or cuke_session.default_pool_size()))
+
+
+class CukeBatch:
+    """
+    Parameters
+    ----------
+    cukes : iterable of Cuke
+        The pages to publish.
+    concurrency : int
+        How many pages to send at once. Defaults to the connection pool size, so every request
+        has a connection to reuse.
+    """
+    def __init__(self, cukes=(), concurrency=None):
+        self.cukes = list(cukes)
+        self.concurrency = concurrency
+
+    def add(self, cuke):
+        self.cukes.append(cuke)
+
+    def __len__(self):
+        return len(self.cukes)
+
+    def __iter__(self):
+        return iter(self.cukes)
+
+    @staticmethod
+    def _update_one(cuke):
+        try:
+            return PageResult(cuke, cuke._update(), None)
+        except Exception as e:
+            return PageResult(cuke, None, e)
+
+    def update(self):
+        """Send every page's dirty state; a PageResult per page, in order."""
+        if not self.cukes:
+            return []
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(concurrency_for(len(self.cukes), self.concurrency), thread_name_prefix="cuke-batch") as pool:
+            return list(pool.map(self._update_one, self.cukes))
+
+
+class OpenReport:
+    """
+    How a bulk open went. `alias` and `total` are in seconds; `pages` maps each page id to how long
+    fetching its state took, and `errors` maps the page ids that failed to the exception.
+    """
+    def __init__(self):
+        self.alias = 0.0
+        self.total = None
+        self.pages = {}
+        self.errors = {}
+        self._started = time.perf_counter()
+
+    def __repr__(self):
+        slowest = max(self.pages.values(), default=0.0)
+        return (f"OpenReport(pages={len(self.pages)}, failed={len(self.errors)}, alias={self.alias:.3f}s, "
+                f"total={self.total or 0.0:.3g}s, slowest={slowest:.3f}s)")
+
+    def record(self, page_id, started, error=None):
+        self.pages[page_id] = time.perf_counter() - started
+        if error is not None:
+            self.errors[page_id] = error
+
+    def finish(self, cukes):
+        self.total = time.perf_counter() - self._started
+        return [None if c._page_id in self.errors else c for c in cukes], self
+
+
+def detached_pages(cls, pages, kwargs):
+    """A `cls` per page that hasn't talked to the server yet; `pages` are page ids or dicts of arguments."""
+    return [cls(connect=False, **{**kwargs, **(page if isinstance(page, dict) else {"page_id": page})})
+            for page in pages]
+
+
+def alias_lookups(cukes):
+    """The pages still needing an alias, grouped by server and API key, so each is looked up once."""
+    groups = {}
+    for cuke in cukes:
+        if (cuke._alias_pending or cuke._slug is None) and cuke._api_key is not None:
+            groups.setdefault((cuke_session.base_url(cuke._url), cuke._api_key), []).append(cuke)
+    return list(groups.values())
+
+
+def open_pages(cls, pages, concurrency=None, **kwargs):
+    """See `Cuke._bulk_open`."""
+    report = OpenReport()
+    cukes = detached_pages(cls, pages, kwargs)
+    started = time.perf_counter()
+    for group in alias_lookups(cukes):
+        alias = group[0]._user_alias
+        for cuke in group:
+            cuke._page_slug = alias
+    report.alias = time.perf_counter() - started
+
+    def attach(cuke):
+        started = time.perf_counter()
+        try:
+            if cuke._page_id and cuke._attach() is False:
+                raise PageNotFound(cuke._page_id)
+        except Exception as e:
+            report.record(cuke._page_id, started, e)
+        else:
+            report.record(cuke._page_id, started)
+
+    if cukes:
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(concurrency_for(len(cukes), concurrency), thread_name_prefix="cuke-batch") as pool:
+            list(pool.map(attach, cukes))
+    return report.finish(cukes)
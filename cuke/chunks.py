@@ -0,0 +1,119 @@
+"""
+Chunked uploads of large values.
+
+With `Cuke(chunk_threshold=...)`, a value whose payload is larger than the threshold isn't put in
+the /store request. It's split into `chunk_size` pieces, each uploaded on its own to
+`/chunk/<sha256>` in parallel over the connection pool, and the /store entry lists the hashes in
+place of the value:
+
+    {"type": "png_b64", "chunks": ["9f86d0...", ...], "size": 209715200}
+
+JSON values are chunked as their encoded bytes and marked `"json": true`.
+
+Chunks are content addressed and shared by every page on a server, so the same image or dataset
+published to many pages is only uploaded once. Before uploading, the client asks the server which
+of the chunks it lacks (`POST /chunks`, in batches), and it remembers, process-wide, the chunks each
+server is known to have, so recently seen ones don't even need that check. When a flush fails part
+way, the retry only uploads the chunks that are still missing.
+
+>>> import cuke.chunks
+>>> cuke.chunks.configure(ttl=3600, max_entries=1_000_000)
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from cuke.encoding import FileStream
+from cuke.session import base_url
+
+DEFAULT_CHUNK_SIZE = 8 << 20
+EXISTENCE_BATCH_SIZE = 1000  # hashes per /chunks request
+
+_config = {"ttl": 600.0, "max_entries": 100_000}
+_known = OrderedDict()  # (base url, hash) -> time.monotonic() when the server was known to have it
+_known_lock = threading.Lock()
+
+
+def configure(ttl=None, max_entries=None):
+    """
+    Set how long, in seconds, a server is assumed to still have a chunk it was known to have, and
+    how many such chunks to remember at most.
+    """
+    if ttl is not None:
+        _config["ttl"] = ttl
+    if max_entries is not None:
+        _config["max_entries"] = max_entries
+
+
+def is_known(url, h):
+    """Whether the server at `url` was recently known to have chunk `h`."""
+    key = (base_url(url), h)
+    with _known_lock:
+        seen = _known.get(key)
+        if seen is None:
+            return False
+        if time.monotonic() - seen > _config["ttl"]:
+            del _known[key]
+            return False
+        return True
+
+
+def remember(url, hashes):
+    """Record that the server at `url` has the chunks `hashes`."""
+    url = base_url(url)
+    now = time.monotonic()
+    with _known_lock:
+        for h in hashes:
+            _known[(url, h)] = now
+            _known.move_to_end((url, h))
+        while len(_known) > _config["max_entries"]:
+            _known.popitem(last=False)
+
+
+def forget(url=None, hashes=None):
+    """Stop assuming the server at `url` (or any) has `hashes` (or any chunk)."""
+    with _known_lock:
+        if url is None and hashes is None:
+            _known.clear()
+            return
+        url = url and base_url(url)
+        for key in list(_known):
+            if (url is None or key[0] == url) and (hashes is None or key[1] in hashes):
+                del _known[key]
+
+
+def size(source):
+    return source.nbytes if isinstance(source, memoryview) else len(source)
+
+
+def read(source, offset, length):
+    """`length` bytes of `source` (bytes-like or FileStream) starting at `offset`."""
+    if isinstance(source, FileStream):
+        return source.read_range(offset, length)
+    return memoryview(source).cast("B")[offset:offset + length]
+
+
+def split(source, chunk_size=DEFAULT_CHUNK_SIZE):
+    """[(sha256 hex digest, offset, length)] of the chunks of `source`."""
+    total = size(source)
+    chunks = []
+    for offset in range(0, total, chunk_size):
+        length = min(chunk_size, total - offset)
+        chunks.append((hashlib.sha256(read(source, offset, length)).hexdigest(), offset, length))
+    return chunks
+
+
+class ChunkBody:
+    """The request body for one chunk: a memoryview sent as is, with a Content-Length."""
+    def __init__(self, data):
+        self._data = data
+
+    def __len__(self):
+        return size(self._data)
+
+    def __iter__(self):
+        yield self._data
+
+    async def aiter(self):
+        yield self._data
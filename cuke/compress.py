@@ -0,0 +1,60 @@
+"""
+Compression of request bodies.
+
+With `Cuke(compression="auto")` (or "zstd", "gzip"), JSON bodies sent to /store and
+/store_template that are at least `compression_threshold` bytes long are compressed and sent with a
+Content-Encoding header. "auto" uses zstd when `zstandard` is installed (`pip install cuke[zstd]`),
+and gzip otherwise. A server that answers 415 is sent the body uncompressed, and isn't sent
+compressed bodies again by this process.
+"""
+import gzip
+import threading
+
+from cuke.session import base_url
+
+DEFAULT_THRESHOLD = 1024
+DEFAULT_LEVELS = {"gzip": 6, "zstd": 3}
+
+_unsupported = set()  # base urls of servers that refused a compressed body
+_lock = threading.Lock()
+
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        return None
+    return zstandard
+
+
+def resolve(method):
+    """The encoding to use for `method`: "zstd", "gzip" or None."""
+    if method == "auto":
+        return "zstd" if _zstandard() is not None else "gzip"
+    if method == "zstd" and _zstandard() is None:
+        raise ImportError("zstd compression needs the zstandard package: pip install cuke[zstd]")
+    if method not in (None, "gzip", "zstd"):
+        raise ValueError(f"Unknown compression {method!r}; use 'auto', 'zstd' or 'gzip'.")
+    return method
+
+
+def compress(data, method, level=None):
+    level = DEFAULT_LEVELS[method] if level is None else level
+    if method == "zstd":
+        return _zstandard().ZstdCompressor(level=level).compress(data)
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+def decompress(data, method):
+    if method == "zstd":
+        return _zstandard().ZstdDecompressor().decompressobj().decompress(data)
+    return gzip.decompress(data)
+
+
+def is_supported(url):
+    return base_url(url) not in _unsupported
+
+
+def mark_unsupported(url):
+    with _lock:
+        _unsupported.add(base_url(url))
@@ -0,0 +1,195 @@
+"""
+JSON encoding for request bodies.
+
+Each value is encoded to bytes exactly once; the /store body is then stitched together from those
+pre-encoded fragments instead of being re-serialized as a whole. orjson is used when it's
+installed (`pip install cuke[fast]`), falling back to the standard library for anything it can't
+encode. Either way the same values are accepted: orjson is kept from encoding dates, dataclasses
+and NaN, which the standard library rejects.
+"""
+import base64
+import json
+import math
+import os
+
+_backend = {"name": None, "dumps": None, "loads": None}
+
+
+def _stdlib_dumps(obj):
+    return json.dumps(obj, separators=(",", ":"), allow_nan=False).encode()
+
+
+def _unserializable(obj):
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _check_finite(obj):
+    """Raise ValueError, as the standard library does, if `obj` holds a NaN or infinite float."""
+    if isinstance(obj, float):
+        if not math.isfinite(obj):
+            raise ValueError("Out of range float values are not JSON compliant")
+    elif isinstance(obj, dict):
+        for value in obj.values():
+            _check_finite(value)
+    elif isinstance(obj, (list, tuple)):
+        for value in obj:
+            _check_finite(value)
+
+
+def use_backend(name=None):
+    """Use "orjson" or "json" for encoding; None picks orjson if it's installed."""
+    if name in (None, "orjson"):
+        try:
+            import orjson
+        except ImportError:
+            if name == "orjson":
+                raise
+        else:
+            # Encode only what the standard library would, so the backend doesn't change what's sent:
+            # dates and dataclasses are passed to `default`, and so rejected, and NaN isn't sent as null.
+            option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+
+            def dumps(obj):
+                try:
+                    data = orjson.dumps(obj, default=_unserializable, option=option)
+                except TypeError:
+                    return _stdlib_dumps(obj)
+                if b"null" in data:
+                    _check_finite(obj)
+                return data
+            _backend.update(name="orjson", dumps=dumps, loads=orjson.loads)
+            return
+    _backend.update(name="json", dumps=_stdlib_dumps, loads=json.loads)
+
+
+def backend():
+    if _backend["name"] is None:
+        use_backend()
+    return _backend["name"]
+
+
+def dumps(obj):
+    """`obj` as compact JSON bytes. Raises TypeError/ValueError if it isn't JSON serializable."""
+    if _backend["dumps"] is None:
+        use_backend()
+    return _backend["dumps"](obj)
+
+
+def loads(data):
+    if _backend["loads"] is None:
+        use_backend()
+    return _backend["loads"](data)
+
+
+def entry_bytes(entry, value_bytes):
+    """Encode `entry`, using the already encoded `value_bytes` for its "value"."""
+    head = dumps({k: v for k, v in entry.items() if k != "value"})
+    return head[:-1] + (b"," if len(head) > 2 else b"") + b'"value":' + value_bytes + b"}"
+
+
+def base64_chunks(data, block=3 << 18):
+    """`data`, bytes-like or a FileStream, base64 encoded piece by piece rather than all at once."""
+    if not isinstance(data, FileStream):
+        data = memoryview(data).cast("B")
+        for start in range(0, len(data), block):
+            yield base64.b64encode(data[start:start + block])
+        return
+    leftover = b""
+    for chunk in data:
+        chunk = leftover + chunk
+        cut = len(chunk) - len(chunk) % 3  # encode whole 3-byte groups, so the pieces join up
+        leftover = chunk[cut:]
+        yield base64.b64encode(chunk[:cut])
+    if leftover:
+        yield base64.b64encode(leftover)
+
+
+def object_bytes(fragments):
+    """Encode a JSON object from a dict of key -> already encoded value."""
+    return b"{" + b",".join(dumps(k) + b":" + fragment for k, fragment in fragments.items()) + b"}"
+
+
+class FileStream:
+    """
+    `size` bytes of the file at `path`, read in chunks when iterated rather than held in memory.
+    Raises OSError if the file has become shorter by the time it's read.
+    """
+    chunk_size = 1 << 20
+
+    def __init__(self, path, size):
+        self.path = path
+        self.size = size
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        remaining = self.size
+        with open(self.path, "rb") as f:
+            while remaining:
+                chunk = f.read(min(self.chunk_size, remaining))
+                if not chunk:
+                    raise OSError(f"{self.path} was truncated while it was being read.")
+                remaining -= len(chunk)
+                yield chunk
+
+    def read(self):
+        return b"".join(self)
+
+    def read_range(self, offset, length):
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            data = f.read(length)
+        if len(data) < length:
+            raise OSError(f"{self.path} was truncated while it was being read.")
+        return data
+
+
+class MultipartBody:
+    """
+    A multipart/form-data request body: the JSON document in a part named "json", followed by one
+    binary part per entry of `parts` (name -> bytes-like or FileStream), which the JSON refers to by
+    name.
+
+    Iterating yields the body in chunks, with the binary parts as memoryviews over the original
+    buffers, or read from their files, so they are never copied or base64-encoded. It has a length, so it's sent with a
+    Content-Length, and can be iterated again if a request is retried.
+    """
+    def __init__(self, json_bytes, parts):
+        self.boundary = os.urandom(16).hex()
+        self.content_type = f"multipart/form-data; boundary={self.boundary}"
+        self._chunks = [self._header("json", "application/json"), json_bytes]
+        for name, data in parts.items():
+            if not isinstance(data, FileStream):
+                data = memoryview(data).cast("B")
+            self._chunks += [b"\r\n", self._header(name, "application/octet-stream"), data]
+        self._chunks.append(f"\r\n--{self.boundary}--\r\n".encode())
+
+    def _header(self, name, content_type):
+        return (f"--{self.boundary}\r\nContent-Disposition: form-data; name=\"{name}\"\r\n"
+                f"Content-Type: {content_type}\r\n\r\n").encode()
+
+    def __len__(self):
+        return sum(chunk.nbytes if isinstance(chunk, memoryview) else len(chunk) for chunk in self._chunks)
+
+    def __iter__(self):
+        for chunk in self._chunks:
+            if isinstance(chunk, FileStream):
+                yield from chunk
+            else:
+                yield chunk
+
+    async def aiter(self):
+        for chunk in self:
+            yield chunk
+
+
+def parse_multipart(body, content_type):
+    """The parts of a multipart/form-data `body`, as name -> bytes. For the stand-in server and tests."""
+    boundary = content_type.split("boundary=")[1].encode()
+    parts = {}
+    for section in body.split(b"--" + boundary)[1:-1]:
+        head, _, data = section.partition(b"\r\n\r\n")
+        name = head.split(b'name="')[1].split(b'"')[0].decode()
+        parts[name] = data[:-2] if data.endswith(b"\r\n") else data
+    return parts
@@ -12,4 +12,21 @@ class NoPageYet(Exception):
 class SetPageIdOnInitialization(Exception):
     """Didn't set page id"""
     def __init__(self):
-        super().__init__("You have an API key, so you need to set a page id when you first intantiate Cuke()")
\ No newline at end of file
+        super().__init__("You have an API key, so you need to set a page id when you first intantiate Cuke()")
+
+class PageNotFound(Exception):
+    """No page with this id on the server"""
+    def __init__(self, page_id):
+        super().__init__(f"There's no page {page_id!r} to attach to.")
+
+class KeyNotLoaded(Exception):
+    """Read a key of an AsyncCuke page loaded with lazy_keys=True before fetching it"""
+    def __init__(self, key):
+        super().__init__(f"{key!r} hasn't been fetched yet: `await cuke._prefetch({key!r})` first.")
+
+
+class AliasNotFetched(Exception):
+    """An AsyncCuke needed its API key's alias before it was fetched"""
+    def __init__(self):
+        super().__init__("The page's alias hasn't been fetched yet: use `await AsyncCuke.create(...)`, or "
+                         "`cuke._page_slug = await cuke._fetch_user_alias()`.")
@@ -0,0 +1,134 @@
+"""
+An on-disk cache of page state, so attaching to a page that this or another process on the host
+has fetched before only downloads it again if it has changed.
+
+>>> import cuke.pagecache
+>>> cuke.pagecache.configure(path="~/.cache/cuke/pages", max_bytes=256 << 20)
+
+The directory can also be set with the CUKE_PAGE_CACHE environment variable; nothing is cached
+until it's set. Each page's state (values, template, code, views) is kept with the ETag the server
+sent for it. Attaching sends that ETag in If-None-Match, and loads the state from disk when the
+server answers 304, so a warm start costs a round trip but no download. Pages protected by basic
+auth aren't cached, as their state includes the password.
+
+Files are replaced atomically and readable only by their owner, so processes can share the
+directory. Once it's over `max_bytes`, the least recently used pages are evicted.
+"""
+import hashlib
+import os
+import tempfile
+import threading
+
+from cuke import encoding
+
+DEFAULT_MAX_BYTES = 256 << 20
+
+_config = {"path": None, "max_bytes": DEFAULT_MAX_BYTES}
+_lock = threading.Lock()
+
+
+def configure(path=None, max_bytes=None):
+    """
+    Parameters
+    ----------
+    path : str
+        Directory to keep page state in. Defaults to $CUKE_PAGE_CACHE, if set.
+    max_bytes : int
+        Most bytes of page state to keep, in total.
+    """
+    if path is not None:
+        _config["path"] = path
+    if max_bytes is not None:
+        _config["max_bytes"] = max_bytes
+
+
+def _directory():
+    path = _config["path"] or os.environ.get("CUKE_PAGE_CACHE")
+    return os.path.expanduser(path) if path else None
+
+
+def _file(directory, url):
+    return os.path.join(directory, hashlib.sha256(url.encode()).hexdigest() + ".json")
+
+
+def get(url):
+    """(etag, state) cached for the page whose state is retrieved from `url`, or None."""
+    directory = _directory()
+    if directory is None:
+        return None
+    path = _file(directory, url)
+    try:
+        with open(path, "rb") as f:
+            entry = encoding.loads(f.read())
+        os.utime(path)  # recently used, so evicted last
+    except (OSError, ValueError):
+        return None
+    if not isinstance(entry, dict) or "etag" not in entry or "state" not in entry:
+        return None
+    return entry["etag"], entry["state"]
+
+
+def put(url, etag, state):
+    """
+    Cache `state`, as served with `etag`; without an ETag it couldn't be revalidated, so it isn't.
+    Neither is the state of a page protected by basic auth, which holds its username and password.
+    """
+    directory = _directory()
+    if directory is None or etag is None:
+        return
+    if isinstance(state, dict) and state.get("__basic_auth__"):
+        invalidate(url)
+        return
+    data = encoding.dumps({"etag": etag, "state": state})
+    try:
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix=".page-")
+    except OSError:
+        return
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, _file(directory, url))
+    except OSError:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        return
+    with _lock:
+        _evict(directory)
+
+
+def _evict(directory):
+    """Remove the least recently used files until the directory is within `max_bytes`."""
+    files = []
+    for entry in os.scandir(directory):
+        if entry.name.endswith(".json"):
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue  # removed by another process
+            files.append((stat.st_mtime, stat.st_size, entry.path))
+    total = sum(size for _, size, _ in files)
+    for _, size, path in sorted(files):
+        if total <= _config["max_bytes"]:
+            break
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+        total -= size
+
+
+def invalidate(url=None):
+    """Forget the state retrieved from `url`, or every page's if it isn't given."""
+    directory = _directory()
+    if directory is None or not os.path.isdir(directory):
+        return
+    paths = [_file(directory, url)] if url is not None else [
+        e.path for e in os.scandir(directory) if e.name.endswith(".json")]
+    for path in paths:
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
@@ -0,0 +1,60 @@
+"""
+Calling a page's functions remotely, singly or many at once.
+
+>>> future = cuke.render_report.submit("2023-06", region="eu")
+>>> for result in cuke.score.map(rows, concurrency=16):
+...     print(result)
+
+Arguments travel as JSON in the body of a POST to the function's execute URL; a call without any is
+a plain GET, as before. `map` keeps at most `concurrency` calls in flight over the shared connection
+pool, and yields results as they arrive: in input order by default, or as (item, result) pairs in
+completion order with `ordered=False`.
+"""
+import threading
+
+from cuke import session as cuke_session
+
+_executor = None
+_lock = threading.Lock()
+
+
+def executor():
+    """The thread pool `submit` runs calls on, sized like the connection pool."""
+    global _executor
+    with _lock:
+        if _executor is None:
+            from concurrent.futures import ThreadPoolExecutor
+            _executor = ThreadPoolExecutor(cuke_session.default_pool_size(), thread_name_prefix="cuke-remote")
+        return _executor
+
+
+def call_body(args, kwargs):
+    """The JSON body carrying a call's arguments, or None if there aren't any."""
+    if not args and not kwargs:
+        return None
+    return {"args": list(args), "kwargs": kwargs}
+
+
+def map_calls(call, iterable, concurrency=None, ordered=True):
+    """`call(item)` for each item, at most `concurrency` at a time; see the module docstring."""
+    from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+    concurrency = concurrency or cuke_session.default_pool_size()
+
+    def finished(pending, block_until):
+        """Pop and yield whatever of `pending` (item, future) is done, waiting while more than `block_until` remain."""
+        while len(pending) > block_until:
+            if ordered:
+                done = [pending.pop(0)]
+            else:
+                ready, _ = wait([f for _, f in pending], return_when=FIRST_COMPLETED)
+                done = [p for p in pending if p[1] in ready]
+                pending[:] = [p for p in pending if p[1] not in ready]
+            for item, future in done:
+                yield future.result() if ordered else (item, future.result())
+
+    with ThreadPoolExecutor(concurrency, thread_name_prefix="cuke-remote") as pool:
+        pending = []
+        for item in iterable:
+            pending.append((item, pool.submit(call, item)))
+            yield from finished(pending, concurrency - 1)
+        yield from finished(pending, 0)
@@ -0,0 +1,118 @@
+"""
+Rendering matplotlib figures for `_update`, off the sending thread and only when they've changed.
+
+Figures are rendered on a small thread pool, so several dirty figures render in parallel, and the
+result is cached per figure and options until the figure changes. Changes are noticed through the
+figure's stale callback, which matplotlib calls whenever any artist on it is modified.
+
+Options are set per key:
+
+>>> cuke = Cuke(figure_options={"plot": {"format": "webp", "dpi": 150, "quality": 80}})
+>>> cuke.plot = fig
+
+Supported formats are "png" (the default), "jpeg", "webp" and "svg"; `quality` applies to the
+lossy ones.
+"""
+import functools
+import io
+import os
+import threading
+import weakref
+
+FORMATS = {"png": "png", "jpeg": "jpeg", "jpg": "jpeg", "webp": "webp", "svg": "svg"}
+
+_config = {"workers": min(4, os.cpu_count() or 1)}
+_pool = None
+_lock = threading.RLock()
+_figure_locks = weakref.WeakKeyDictionary()  # figure -> lock held while it renders
+_generations = weakref.WeakKeyDictionary()  # figure -> number of times it has gone stale
+_rendering = weakref.WeakKeyDictionary()  # figure -> ident of the thread rendering it
+_cache = weakref.WeakKeyDictionary()  # figure -> {options: (generation, future)}
+
+
+def configure(workers=None):
+    """Set how many figures may render at once. Takes effect for pools created from now on."""
+    global _pool
+    if workers is not None:
+        with _lock:
+            _config["workers"] = workers
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+                _pool = None
+
+
+def _get_pool():
+    global _pool
+    with _lock:
+        if _pool is None:
+            from concurrent.futures import ThreadPoolExecutor
+            _pool = ThreadPoolExecutor(_config["workers"], thread_name_prefix="cuke-render")
+        return _pool
+
+
+@functools.lru_cache(maxsize=None)
+def _is_figure_type(cls):
+    return any(f"{c.__module__}.{c.__qualname__}" == "matplotlib.figure.Figure" for c in cls.__mro__)
+
+
+def is_figure(value):
+    return _is_figure_type(type(value))
+
+
+def _options(format="png", dpi=None, quality=None):
+    if format not in FORMATS:
+        raise ValueError(f"Can't render figures as {format!r}; use one of {sorted(FORMATS)}.")
+    return FORMATS[format], dpi, quality
+
+
+def _watch(fig):
+    """Start counting changes to `fig`, keeping whatever stale callback it already had."""
+    if fig in _generations:
+        return
+    _generations[fig] = 0
+    _figure_locks[fig] = threading.Lock()
+    previous = fig.stale_callback
+    ref = weakref.ref(fig)
+
+    def on_stale(artist, stale):
+        fig = ref()
+        # Rendering itself can mark the figure stale (e.g. by switching its dpi); that's not a change.
+        if fig is not None and stale and _rendering.get(fig) != threading.get_ident():
+            _generations[fig] += 1
+        if previous is not None:
+            previous(artist, stale)
+    fig.stale_callback = on_stale
+
+
+def _render(fig, options):
+    format, dpi, quality = options
+    kwargs = {"format": format}
+    if dpi is not None:
+        kwargs["dpi"] = dpi
+    if quality is not None and format in ("jpeg", "webp"):
+        kwargs["pil_kwargs"] = {"quality": quality}
+    buf = io.BytesIO()
+    with _figure_locks[fig]:
+        _rendering[fig] = threading.get_ident()
+        try:
+            fig.savefig(buf, **kwargs)
+        finally:
+            del _rendering[fig]
+    return {"type": f"{format}_b64", "value": buf.getbuffer()}
+
+
+def render(fig, **options):
+    """
+    A future for `fig`'s entry, rendered with `options` (format, dpi, quality) on the pool, or the
+    one already rendered if the figure hasn't changed since.
+    """
+    options = _options(**options)
+    with _lock:
+        _watch(fig)
+        generation = _generations[fig]
+        cached = _cache.setdefault(fig, {}).get(options)
+        if cached is not None and cached[0] == generation and not (cached[1].done() and cached[1].exception()):
+            return cached[1]
+        future = _get_pool().submit(_render, fig, options)
+        _cache[fig][options] = (generation, future)
+        return future
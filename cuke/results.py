@@ -0,0 +1,112 @@
+"""
+A cache of remote function results, for functions that return the same thing for the same inputs.
+
+>>> from cuke.results import ResultCache
+>>> c = Cuke(page_id="...", editor_key="...", result_cache=ResultCache(ttl=5, max_entries=1000))
+>>> c.summary("2023-06")  # fetched
+>>> c.summary("2023-06")  # from the cache, no request
+
+Results are keyed on the page, the function's name, a hash of its code and the arguments, so
+changing the function or calling it with different arguments never returns a stale result. A
+fresh entry is returned without a request; once it's older than `ttl` it's revalidated with
+If-None-Match if the server gave an ETag for it, which costs a 304 rather than re-running the
+function. The least recently used entries are evicted beyond `max_entries` or `max_bytes`.
+
+One cache can be shared between pages; pass `result_cache=True` for a cache of the page's own with the
+default limits.
+"""
+import marshal
+import threading
+import time
+from collections import OrderedDict
+
+from cuke import encoding
+from cuke.util import digest
+
+DEFAULT_TTL = 60
+DEFAULT_MAX_ENTRIES = 1024
+DEFAULT_MAX_BYTES = 64 << 20
+
+
+class ResultCache:
+    """
+    Parameters
+    ----------
+    ttl : float
+        How long a result is used without asking the server, in seconds. 0 revalidates every call.
+    max_entries : int
+        Most results to keep.
+    max_bytes : int
+        Most bytes of results to keep, in total.
+    """
+    def __init__(self, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES, max_bytes=DEFAULT_MAX_BYTES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (text, etag, expiry as time.monotonic())
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __repr__(self):
+        return (f"ResultCache(entries={len(self)}, bytes={self._bytes}, hits={self.hits}, "
+                f"revalidated={self.revalidated}, misses={self.misses})")
+
+    @staticmethod
+    def key(url, fn, args, kwargs):
+        """The cache key for calling `fn` at execute `url` with `args` and `kwargs`."""
+        call = encoding.dumps({"args": list(args), "kwargs": dict(sorted(kwargs.items()))})
+        code = getattr(fn, "__code__", None)
+        if code is not None:
+            source = marshal.dumps(code)
+        else:
+            source = getattr(fn, "body", repr(fn)).encode()  # a DeferredFunction isn't compiled yet
+        return digest(url.encode(), source, call)
+
+    def lookup(self, key):
+        """(text, etag, fresh) for `key`, or None if it isn't cached."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            text, etag, expiry = entry
+            fresh = expiry > time.monotonic()
+            if fresh:
+                self.hits += 1
+            elif etag is None:
+                self.misses += 1
+                return None
+            return text, etag, fresh
+
+    def store(self, key, text, etag=None):
+        with self._lock:
+            self._discard(key)
+            self._entries[key] = (text, etag, time.monotonic() + self.ttl)
+            self._bytes += len(text)
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                self._discard(next(iter(self._entries)))
+
+    def refresh(self, key):
+        """The server said the entry for `key` is still current (a 304): use it for another `ttl`."""
+        with self._lock:
+            self.revalidated += 1
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries[key] = (entry[0], entry[1], time.monotonic() + self.ttl)
+
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= len(entry[0])
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
@@ -0,0 +1,100 @@
+"""
+How `_update` turns values that aren't plain JSON into something it can send.
+
+A serializer takes a value and returns an entry, `{"type": ..., "value": ...}`. Binary payloads
+can be returned as bytes-like objects (bytes, memoryview) or a `cuke.encoding.FileStream`; the
+client takes care of encoding them for the wire. Serializers are looked up along the value's MRO, so registering a base class covers
+its subclasses, and the result is cached per type.
+
+>>> from cuke.serializers import register
+>>> @register(Decimal)
+... def decimal_serializer(value):
+...     return {"type": "basic", "value": str(value)}
+
+Types from optional dependencies can be registered by dotted name ("numpy.ndarray"), so they
+needn't be imported until a value of that type actually shows up.
+"""
+import threading
+import types
+
+from cuke import render
+from cuke.types import Image
+from cuke.util import DeferredFunction, get_function_body
+
+_registry = {}  # type or "module.QualName" -> serializer
+_cache = {}  # type -> serializer, or None when there isn't one
+_lock = threading.Lock()
+
+
+def _name(cls):
+    return f"{cls.__module__}.{cls.__qualname__}"
+
+
+def register(cls, serializer=None):
+    """Register `serializer` for `cls` (a type or its dotted name). Usable as a decorator."""
+    def decorator(serializer):
+        with _lock:
+            _registry[cls] = serializer
+            _cache.clear()
+        return serializer
+    if serializer is None:
+        return decorator
+    return decorator(serializer)
+
+
+def unregister(cls):
+    with _lock:
+        _registry.pop(cls, None)
+        _cache.clear()
+
+
+def serializer_for(cls):
+    """The serializer registered for `cls` or its nearest base class, or None."""
+    try:
+        return _cache[cls]
+    except KeyError:
+        pass
+    found = None
+    for base in cls.__mro__:
+        found = _registry.get(base) or _registry.get(_name(base))
+        if found is not None:
+            break
+    _cache[cls] = found
+    return found
+
+
+@register(types.FunctionType)
+def function_serializer(value):
+    return {"type": "function", "value": get_function_body(value)}
+
+
+@register(DeferredFunction)
+def deferred_function_serializer(value):
+    return {"type": "function", "value": value.body}
+
+
+@register("matplotlib.figure.Figure")
+def figure_serializer(value):
+    """PNG at the figure's own dpi, reusing the last render if it hasn't changed since."""
+    return render.render(value).result()
+
+
+@register(Image)
+def image_serializer(value):
+    return {"type": "png_b64", "value": value.stream()}
+
+
+@register("numpy.ndarray")
+def ndarray_serializer(value):
+    """Raw dtype, shape and buffer - no round trip through Python lists."""
+    if value.dtype.hasobject:
+        return {"type": "basic", "value": value.tolist()}
+    if not value.flags.c_contiguous:
+        value = value.copy(order="C")
+    return {"type": "ndarray", "dtype": value.dtype.str, "shape": list(value.shape),
+            "value": memoryview(value.reshape(-1).view("u1"))}
+
+
+@register("numpy.generic")
+def numpy_scalar_serializer(value):
+    return {"type": "basic", "value": value.item()}
@@ -0,0 +1,89 @@
+"""
+Pooled keep-alive HTTP sessions, shared by every Cuke in the process.
+
+Sessions are keyed by base URL (scheme://host:port) so all pages on the same server reuse the
+same connection pool, rather than paying a TCP+TLS handshake per request.
+
+>>> import cuke.session
+>>> cuke.session.configure(pool_size=32, timeout=(3, 10))
+>>> cuke.session.set_session("https://cuke.cool", my_session)  # bring your own
+"""
+import threading
+from urllib.parse import urlsplit
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_TIMEOUT = (5, 60)  # (connect, read) seconds
+
+_config = {"pool_size": DEFAULT_POOL_SIZE, "timeout": DEFAULT_TIMEOUT}
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def base_url(url):
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+def configure(pool_size=None, timeout=None):
+    """
+    Set the pool size and default per-request timeout for sessions created from now on.
+
+    Parameters
+    ----------
+    pool_size : int
+        Maximum number of keep-alive connections kept per base URL.
+    timeout : float or (float, float)
+        Default timeout, in seconds, passed to every request. A tuple is (connect, read).
+    """
+    if pool_size is not None:
+        _config["pool_size"] = pool_size
+    if timeout is not None:
+        _config["timeout"] = timeout
+
+
+def default_timeout():
+    return _config["timeout"]
+
+
+def default_pool_size():
+    return _config["pool_size"]
+
+
+def new_session(pool_size=None):
+    """A requests.Session with a keep-alive connection pool of `pool_size` connections."""
+    # Imported here rather than at the top, so `import cuke` stays fast for code that never sends.
+    import requests
+    from requests.adapters import HTTPAdapter
+    pool_size = pool_size or default_pool_size()
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def get_session(url):
+    """The shared session for the server at `url`, creating it on first use."""
+    key = base_url(url)
+    session = _sessions.get(key)
+    if session is not None:
+        return session
+    with _sessions_lock:
+        if key not in _sessions:
+            _sessions[key] = new_session()
+        return _sessions[key]
+
+
+def set_session(url, session):
+    """Use `session` for every Cuke talking to the server at `url`."""
+    with _sessions_lock:
+        _sessions[base_url(url)] = session
+
+
+def close_sessions():
+    """Close and forget all pooled sessions. New ones are created on next use."""
+    with _sessions_lock:
+        sessions = list(_sessions.values())
+        _sessions.clear()
+    for session in sessions:
+        session.close()
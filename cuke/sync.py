@@ -0,0 +1,27 @@
+"""
+Incremental synchronization with the server.
+
+>>> result = cuke._sync()
+>>> result.conflicts
+{'x': 3}
+
+The page's state carries a revision. `_sync()` asks /retrieve for what changed since the revision
+this object last saw (`?since=`), merges it into the local state and then sends the local changes,
+so its cost grows with the size of the change rather than the page. Keys assigned locally but not
+sent yet are never overwritten: if the server changed them too, they're reported as conflicts,
+with the server's value, and the local value is sent (or, with `on_conflict="remote"`, the
+server's value is taken and the local one dropped).
+
+A server without revisions answers with the whole state, which is merged the same way.
+"""
+from collections import namedtuple
+
+# /retrieve fields holding page settings rather than values -> the attribute each is loaded into
+PAGE_FIELDS = {"__template__": "_template", "__basic_auth__": "_basic_auth", "__code__": "_code",
+               "__private__": "_private", "__title__": "_title", "__views__": "_views"}
+
+SyncResult = namedtuple("SyncResult", ["revision", "changed", "conflicts", "update"])
+SyncResult.__doc__ = """
+The revision now seen, the keys (or page settings, like "_template") taken from the server, the
+conflicting keys mapped to the server's value, and what `_update()` returned.
+"""
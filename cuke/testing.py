@@ -0,0 +1,318 @@
+"""
+A small in-process stand-in for the cuke.cool server, for testing the client offline.
+
+>>> with StubServer() as server:
+...     cuke = Cuke(url=server.url, user_agent="me")
+...     cuke._template = "hello {{ x }}"
+...     cuke.x = 1
+...     cuke._update()
+
+It only implements the endpoints the client talks to, keeps everything in memory, and counts
+requests and connections so tests can make assertions about the wire traffic.
+"""
+import base64
+import hashlib
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from cuke import compress
+from cuke.delta import apply_patch
+from cuke.encoding import parse_multipart
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        with self.server.stub._lock:
+            self.server.stub.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status, body=b"", content_type="application/json", headers=None):
+        if not isinstance(body, bytes):
+            body = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return self.rfile.read(length) if length else b""
+
+    def _dispatch(self, method):
+        stub = self.server.stub
+        body = self._body()
+        with stub._lock:
+            stub.requests.append((method, self.path, dict(self.headers), body))
+        segments = [s for s in self.path.split("?")[0].split("/") if s]
+        failure = stub._take_failure(segments[0] if segments else "")
+        if failure is not None:
+            return self._reply(failure, {"error": "injected failure"})
+        if stub.delay:
+            time.sleep(stub.delay)
+        content_encoding = self.headers.get("Content-Encoding")
+        if content_encoding:
+            if content_encoding not in stub.accept_encodings:
+                return self._reply(415, {"error": f"unsupported content encoding {content_encoding}"})
+            body = compress.decompress(body, content_encoding)
+        handler = getattr(stub, f"_{method.lower()}_{segments[0]}", None) if segments else None
+        if handler is None:
+            return self._reply(404, {"error": "not found"})
+        result = handler(self, segments[1:], body)
+        self._reply(*result)
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+
+class StubServer:
+    """
+    Stand-in cuke.cool server running on a background thread.
+
+    Parameters
+    ----------
+    alias : str
+        Alias returned for any API key by /user/get_alias.
+    delay : float
+        Seconds to wait before answering each request, to simulate a slow network.
+    accept_encodings : tuple of str
+        Content-Encodings accepted for request bodies; others are refused with 415.
+    """
+    def __init__(self, alias="testuser", delay=0, accept_encodings=("gzip", "zstd")):
+        self.alias = alias
+        self.delay = delay
+        self.accept_encodings = accept_encodings
+        self._failures = []
+        self.pages = {}
+        self.requests = []
+        self.connections = 0
+        self.functions = {}
+        self.chunks = {}  # sha256 hex digest -> bytes
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        self._httpd.daemon_threads = True
+        self._httpd.stub = self
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True, name="stub-server")
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def requests_to(self, endpoint, method=None):
+        """Requests received whose path starts with `/endpoint`."""
+        return [r for r in self.requests
+                if r[1].startswith(f"/{endpoint}") and (method is None or r[0] == method)]
+
+    def page(self, page_id):
+        return self.pages[page_id]
+
+    def fail_next(self, endpoint, status=500, times=1):
+        """Answer the next `times` requests to `/endpoint` with `status`."""
+        with self._lock:
+            self._failures.extend([(endpoint, status)] * times)
+
+    def _take_failure(self, endpoint):
+        with self._lock:
+            for i, (failing, status) in enumerate(self._failures):
+                if failing == endpoint:
+                    del self._failures[i]
+                    return status
+        return None
+
+    def _get_user(self, request, segments, body):
+        if segments != ["get_alias"]:
+            return 404, {"error": "not found"}
+        if not request.headers.get("Authorization"):
+            return 401, {"error": "unauthorized"}
+        return 200, {"alias": self.alias}
+
+    def _post_store_template(self, request, segments, body):
+        payload = json.loads(body)
+        api_key = request.headers.get("Authorization")
+        page_id = payload["page_id"] or uuid.uuid4().hex[:12]
+        with self._lock:
+            page = self.pages.get(page_id)
+            if page is None:
+                slug = self.alias if api_key else request.headers.get("User-Agent", "anonymous")
+                page = self.pages[page_id] = {
+                    "slug": slug, "subslug": payload["page_subslug"], "vars": {},
+                    "__template__": None, "__code__": {}, "__basic_auth__": {}, "__private__": False,
+                    "__title__": None, "__views__": 0, "revision": 0,
+                    "changed": {},  # key, or "__fields__" for the page settings -> revision it last changed in
+                    "editor_key": uuid.uuid4().hex, "contributor_key": uuid.uuid4().hex,
+                }
+            page["__template__"] = payload["template"]
+            page["__code__"] = payload["code"]
+            page["revision"] += 1
+            page["changed"]["__fields__"] = page["revision"]
+            if payload.get("username"):
+                page["__basic_auth__"] = {"username": payload["username"], "password": payload["password"]}
+        parts = [page["slug"], page["subslug"], page_id] if page["subslug"] else [page["slug"], page_id]
+        return 200, {"url": "/page/" + "/".join(parts), "page_slug": page["slug"],
+                     "page_subslug": page["subslug"], "page_id": page_id,
+                     "contributor_key": page["contributor_key"], "editor_key": page["editor_key"]}
+
+    def _find_page(self, segments):
+        page = self.pages.get(segments[-1]) if segments else None
+        if page is None or page["slug"] != segments[0]:
+            return None
+        return page
+
+    def _post_store(self, request, segments, body):
+        page = self._find_page(segments)
+        if page is None:
+            return 404, {"error": "no such page"}
+        content_type = request.headers.get("Content-Type", "")
+        if content_type.startswith("multipart/form-data"):
+            # Binary values arrive as raw parts; keep them as the base64 a JSON body would have had.
+            parts = parse_multipart(body, content_type)
+            update = json.loads(parts.pop("json"))
+            for entry in update.values():
+                if "part" in entry:
+                    entry["value"] = base64.b64encode(parts[entry.pop("part")]).decode()
+        else:
+            update = json.loads(body)
+        with self._lock:
+            missing = [h for entry in update.values() for h in entry.get("chunks", ()) if h not in self.chunks]
+            if missing:
+                return 409, {"missing_chunks": missing}
+            for entry in update.values():
+                if "chunks" in entry:
+                    data = b"".join(self.chunks[h] for h in entry.pop("chunks"))
+                    del entry["size"]
+                    entry["value"] = json.loads(data) if entry.pop("json", False) else base64.b64encode(data).decode()
+            conflicts = [k for k, entry in update.items() if k != "__meta__" and not self._applies(page, k, entry)]
+            if conflicts:
+                return 409, {"conflicts": conflicts}
+            meta = update.pop("__meta__", {})
+            for key, value in meta.items():
+                page[f"_{key}__"] = value
+            for k, entry in update.items():
+                if entry["type"] == "delta":
+                    value = apply_patch(page["vars"][k]["value"], entry["patch"])
+                    entry = {"type": "basic", "value": value, "version": entry["version"]}
+                elif entry["type"] == "series_append":
+                    series = page["vars"][k]
+                    series["points"].extend(entry["points"])
+                    if series["maxlen"] is not None and len(series["points"]) > series["maxlen"]:
+                        series["start"] += len(series["points"]) - series["maxlen"]
+                        del series["points"][:-series["maxlen"]]
+                    series["tail"] = entry["tail"]
+                    entry = series
+                page["vars"][k] = entry
+            page["revision"] += 1
+            for k in update:
+                page["changed"][k] = page["revision"]
+            if meta:
+                page["changed"]["__fields__"] = page["revision"]
+        return 200, {"stored": sorted(update)}
+
+    def _post_chunk(self, request, segments, body):
+        if len(segments) != 1 or hashlib.sha256(body).hexdigest() != segments[0]:
+            return 400, {"error": "chunk doesn't match its hash"}
+        with self._lock:
+            self.chunks[segments[0]] = body
+        return 200, {"stored": segments[0]}
+
+    def _post_chunks(self, request, segments, body):
+        """Which of the chunks in the batch the server doesn't have."""
+        with self._lock:
+            return 200, {"missing": [h for h in json.loads(body)["hashes"] if h not in self.chunks]}
+
+    @staticmethod
+    def _applies(page, key, entry):
+        """Whether an incremental entry builds on what the page has for `key`."""
+        current = page["vars"].get(key, {})
+        if entry["type"] == "delta":
+            return current.get("version") == entry["base"]
+        if entry["type"] == "series_append":
+            return (current.get("id") == entry["id"]
+                    and current["start"] + len(current["points"]) == entry["start"])
+        return True
+
+    def _get_retrieve(self, request, segments, body):
+        """
+        The page state, with its revision as the ETag. With ?manifest=1, only the type, version and
+        size of each value, except the values named by ?keys=; with just ?keys=, only those values;
+        with ?since=, only what changed after that revision.
+        """
+        page = self._find_page(segments)
+        if page is None:
+            return 404, {"error": "no such page"}
+        query = parse_qs(urlsplit(request.path).query)
+        keys = set(query.get("keys", []))
+        with self._lock:
+            if "manifest" not in query and keys:
+                return 200, {k: v for k, v in page["vars"].items() if k in keys}
+            if "since" in query:
+                return 200, self._changes_since(page, int(query["since"][0]))
+            resp = dict(page["vars"])
+            if "manifest" in query:
+                resp = {k: v if k in keys else {**{f: v[f] for f in ("type", "version") if f in v},
+                                                "size": len(json.dumps(v.get("value", v)))}
+                        for k, v in resp.items()}
+                resp["__manifest__"] = True
+            for key in ("__template__", "__basic_auth__", "__code__", "__private__", "__title__", "__views__"):
+                resp[key] = page[key]
+            resp["__revision__"] = page["revision"]
+            etag = f'"{page["revision"]}"'
+        if request.headers.get("If-None-Match") == etag and not query:
+            return 304, b"", "application/json", {"ETag": etag}
+        return 200, json.dumps(resp).encode(), "application/json", {"ETag": etag}
+
+    @staticmethod
+    def _changes_since(page, since):
+        changed = {k for k, revision in page["changed"].items() if revision > since}
+        resp = {"__revision__": page["revision"], "__deleted__": [],
+                "__changed__": {k: v for k, v in page["vars"].items() if k in changed}}
+        if "__fields__" in changed:
+            for key in ("__template__", "__basic_auth__", "__code__", "__private__", "__title__", "__views__"):
+                resp[key] = page[key]
+        return resp
+
+    def _get_page(self, request, segments, body):
+        if len(segments) < 4 or segments[-2] != "execute":
+            return 404, {"error": "not found"}
+        page = self._find_page(segments[:-2])
+        if page is None:
+            return 404, {"error": "no such page"}
+        key = segments[-1]
+        call = json.loads(body) if body else {}
+        fn = self.functions.get(key, lambda *args, **kwargs: key)
+        result = str(fn(*call.get("args", []), **call.get("kwargs", {}))).encode()
+        etag = f'"{hashlib.sha256(result).hexdigest()[:32]}"'
+        if request.headers.get("If-None-Match") == etag:
+            return 304, b"", "text/plain", {"ETag": etag}
+        return 200, result, "text/plain", {"ETag": etag}
+
+    _post_page = _get_page
@@ -1,12 +1,177 @@
+import os
+import threading
+from collections import deque
+
+from cuke.encoding import FileStream
+
+
 class Image:
+    """
+    An image, from bytes in memory or a file on disk.
+
+    A file isn't held in memory: it's streamed into each upload. `_update` compares the file's
+    inode, size and mtime with what it last sent and skips the upload when none changed, so
+    reassigning an `Image` of a file that's rewritten now and then is cheap. This doesn't need
+    `dedupe`: the server doesn't change images itself, and fetching another value for the key, with
+    `_sync`, makes the next assignment upload the file again.
+    """
     def __init__(self, path=None, data=None):
         if path is None and data is None:
             raise ValueError("Either path or data must be provided")
         self.path = path
         self._data = data
+
     @property
     def data(self):
         if self._data is None:
             with open(self.path, "rb") as f:
-                self._data = f.read()
-        return self._data
\ No newline at end of file
+                return f.read()
+        return self._data
+
+    def stat(self):
+        """(inode, size, mtime in ns) of the file, or None for an image held in memory."""
+        if self._data is not None:
+            return None
+        st = os.stat(self.path)
+        return st.st_ino, st.st_size, st.st_mtime_ns
+
+    def stream(self):
+        """The image's bytes: the in-memory data, or a FileStream reading the file as it is now."""
+        if self._data is not None:
+            return self._data
+        return FileStream(self.path, self.stat()[1])
+
+
+class Series:
+    """
+    An append-only sequence of numbers, like a training loss, that `_update` publishes incrementally:
+    only the points added since the server's last acknowledged one are sent.
+
+    >>> losses = Series(maxlen=10_000, downsample="minmax", bucket=100)
+    >>> for step in range(steps):
+    ...     losses.append(train_step())
+    ...     cuke.loss = losses
+
+    Parameters
+    ----------
+    values : iterable of float
+        Initial values.
+    maxlen : int
+        Keep only the most recent `maxlen` published points (a ring buffer); older ones are dropped
+        here and on the server.
+    downsample : str
+        None to publish every value, or summarize each `bucket` consecutive values as: "minmax" (their
+        min and max), "mean", or "lttb" (the one point that best preserves the line's shape, Largest
+        Triangle Three Buckets). Downsampled points are published as [index, value] pairs.
+    bucket : int
+        Number of raw values per downsampling bucket.
+    """
+    def __init__(self, values=(), maxlen=None, downsample=None, bucket=100):
+        if downsample not in (None, "minmax", "mean", "lttb"):
+            raise ValueError(f"Unknown downsample method {downsample!r}")
+        self.id = os.urandom(16).hex()
+        self.maxlen = maxlen
+        self.downsample = downsample
+        self.bucket = bucket
+        self._points = deque(maxlen=maxlen)  # published points
+        self._emitted = 0  # points ever published; the absolute index after the last one
+        self._count = 0  # raw values ever appended
+        self._pending = []  # [index, value] of the bucket being filled
+        self._lagging = None  # lttb: the completed bucket whose point waits on the next bucket
+        self._last = None  # lttb: the previously selected point
+        self._lock = threading.Lock()
+        self.extend(values)
+
+    @classmethod
+    def _from_entry(cls, entry):
+        """
+        The series as fetched from a page, so appending to it carries on where the server is. Raw
+        values already summarized aren't kept, so only what's retained and the tail can be restored.
+        """
+        series = cls(maxlen=entry.get("maxlen"), downsample=entry.get("downsample"), bucket=entry.get("bucket", 100))
+        series.id = entry["id"]
+        series._points.extend(entry["points"])
+        series._emitted = entry["start"] + len(entry["points"])
+        tail = entry.get("tail", [])
+        if series.downsample is None:
+            series._count = series._emitted
+            return series
+        last = tail[-1] if tail else entry["points"][-1] if entry["points"] else None
+        series._count = last[0] + 1 if last is not None else 0
+        if series.downsample == "lttb" and len(tail) >= series.bucket:
+            series._lagging, tail = tail[:series.bucket], tail[series.bucket:]
+            series._last = entry["points"][-1] if entry["points"] else None
+        series._pending = list(tail)
+        return series
+
+    def __len__(self):
+        return self._count
+
+    def append(self, value):
+        with self._lock:
+            self._append(value)
+
+    def extend(self, values):
+        with self._lock:
+            for value in values:
+                self._append(value)
+
+    def _append(self, value):
+        if self.downsample is None:
+            self._emit(value)
+        else:
+            self._pending.append([self._count, value])
+            if len(self._pending) == self.bucket:
+                self._close_bucket(self._pending)
+                self._pending = []
+        self._count += 1
+
+    def _emit(self, point):
+        self._points.append(point)
+        self._emitted += 1
+
+    def _close_bucket(self, bucket):
+        if self.downsample == "minmax":
+            lo = min(bucket, key=lambda p: p[1])
+            hi = max(bucket, key=lambda p: p[1])
+            for point in sorted({id(lo): lo, id(hi): hi}.values()):
+                self._emit(point)
+        elif self.downsample == "mean":
+            self._emit([bucket[0][0], sum(p[1] for p in bucket) / len(bucket)])
+        else:
+            lagging, self._lagging = self._lagging, bucket
+            if lagging is None:
+                self._last = bucket[0]
+                self._emit(self._last)
+                self._lagging = bucket[1:] or None
+                return
+            self._last = _largest_triangle(self._last, lagging, bucket)
+            self._emit(self._last)
+
+    def _tail(self):
+        """Values not yet summarized into published points, shown as-is until their bucket closes."""
+        return (self._lagging or []) + self._pending
+
+    def _entry(self, since=None):
+        """
+        The serialized series: everything still retained, or - if `since` is given and still
+        retained - only the points from absolute index `since` on.
+        """
+        with self._lock:
+            first = self._emitted - len(self._points)
+            entry = {"id": self.id, "tail": list(self._tail())}
+            if since is not None and first <= since <= self._emitted:
+                retained = len(self._points)
+                points = [self._points[i] for i in range(retained - (self._emitted - since), retained)]
+                entry.update(type="series_append", start=since, points=points)
+            else:
+                entry.update(type="series", start=first, points=list(self._points), maxlen=self.maxlen,
+                             downsample=self.downsample, bucket=self.bucket)
+            return entry, self._emitted
+
+
+def _largest_triangle(a, bucket, next_bucket):
+    """The point of `bucket` forming the largest triangle with `a` and the average of `next_bucket`."""
+    cx = sum(p[0] for p in next_bucket) / len(next_bucket)
+    cy = sum(p[1] for p in next_bucket) / len(next_bucket)
+    return max(bucket, key=lambda b: abs((a[0] - cx) * (b[1] - a[1]) - (a[0] - b[0]) * (cy - a[1])))
@@ -0,0 +1,163 @@
+"""
+Background flushing of dirty variables.
+
+An Updater owns a thread that sleeps on a condition variable until a key becomes dirty, then sends
+it with `cuke._update()`. It is used in two ways:
+
+* `cuke._start(update_interval)`: send as soon as something is dirty, but at most once every
+  `update_interval` seconds.
+* `Cuke(instant_updates=True, coalesce_latency=..., coalesce_batch_size=...)`: batch assignments
+  into one request, sent when the oldest unsent one is `coalesce_latency` seconds old, when
+  `coalesce_batch_size` keys are dirty, or on `cuke._flush()` - whichever comes first.
+
+Failed sends are retried with exponential backoff and jitter; the keys stay dirty meanwhile, so
+nothing is lost. Whatever is still dirty when the updater is stopped, or the interpreter exits,
+gets one final flush bounded by `flush_timeout`.
+"""
+import atexit
+import random
+import threading
+import time
+import weakref
+
+_live = weakref.WeakSet()
+
+
+def backoff_delay(failures, base, maximum):
+    """How long to wait before retrying after `failures` consecutive failed sends, with jitter."""
+    delay = min(maximum, base * 2 ** (failures - 1))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+class Updater:
+    """
+    Parameters
+    ----------
+    max_latency : float
+        How long to wait after a key becomes dirty, to collect others, before sending.
+    min_interval : float
+        Minimum spacing between the starts of consecutive sends, in seconds.
+    max_batch : int
+        Send straight away once this many keys are dirty.
+    backoff_base, backoff_max : float
+        First and largest retry delay after a failed send, in seconds.
+    flush_timeout : float
+        How long the final flush on stop or exit may take, in seconds.
+    """
+    def __init__(self, cuke, max_latency=0.0, min_interval=0.0, max_batch=None,
+                 backoff_base=0.5, backoff_max=60.0, flush_timeout=5.0):
+        self._cuke = weakref.ref(cuke)
+        self.max_latency = max_latency
+        self.min_interval = min_interval
+        self.max_batch = max_batch
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.flush_timeout = flush_timeout
+        self.last_error = None
+        self.last_success = None  # time.time() of the last successful send
+        self.failures = 0  # consecutive failed sends
+        self._cond = threading.Condition()
+        self._deadline = None  # when to send what's dirty; None if nothing is waiting
+        self._not_before = 0.0  # earliest monotonic time the next send may start
+        self._stopped = False
+        self._thread = None
+        _live.add(self)
+
+    @property
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        with self._cond:
+            if not self.is_running:
+                self._stopped = False
+                self._thread = threading.Thread(target=self._run, daemon=True, name="updater")
+                self._thread.start()
+
+    def notify(self, n_dirty):
+        """Record that a key became dirty; `n_dirty` is how many are dirty now."""
+        with self._cond:
+            now = time.monotonic()
+            if self._deadline is None:
+                self._deadline = now + self.max_latency
+            if self.max_batch is not None and n_dirty >= self.max_batch:
+                self._deadline = now
+            self._cond.notify()
+            stopped = self._stopped
+        if not stopped and not self.is_running:
+            self.start()
+
+    def cancel(self):
+        """Forget the pending deadline, e.g. because the caller is flushing right now."""
+        with self._cond:
+            self._deadline = None
+
+    def stop(self, flush=True):
+        """Stop the thread and, if `flush`, send whatever is still dirty (within `flush_timeout`)."""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(self.flush_timeout)
+        if flush:
+            return self.flush()
+        return True
+
+    def flush(self):
+        """Send what's dirty from a helper thread, giving up after `flush_timeout`. True if it finished."""
+        cuke = self._cuke()
+        if cuke is None or not len(cuke._dirty_set):
+            return True
+        flusher = threading.Thread(target=self._send, args=(cuke, ), daemon=True, name="final-flush")
+        del cuke
+        flusher.start()
+        flusher.join(self.flush_timeout)
+        return not flusher.is_alive()
+
+    def _send(self, cuke):
+        try:
+            cuke._update()
+        except Exception as e:
+            self.failures += 1
+            self.last_error = e
+            return False
+        self.failures = 0
+        self.last_success = time.time()
+        return True
+
+    def _backoff(self):
+        return backoff_delay(self.failures, self.backoff_base, self.backoff_max)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._stopped and self._deadline is None:
+                    self._cond.wait()
+                if self._stopped:
+                    return
+                now = time.monotonic()
+                send_at = max(self._deadline, self._not_before)
+                if send_at > now:
+                    self._cond.wait(send_at - now)
+                    continue
+                self._deadline = None
+            cuke = self._cuke()
+            if cuke is None:
+                return
+            started = time.monotonic()
+            ok = self._send(cuke)
+            del cuke
+            with self._cond:
+                if ok:
+                    self._not_before = started + self.min_interval
+                else:
+                    # The keys are dirty again; retry them once the backoff has passed.
+                    self._not_before = time.monotonic() + self._backoff()
+                    if self._deadline is None:
+                        self._deadline = self._not_before
+
+
+@atexit.register
+def _flush_at_exit():
+    for updater in list(_live):
+        updater.stop(flush=True)
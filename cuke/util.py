@@ -1,11 +1,24 @@
-import inspect
+import hashlib
 from itertools import dropwhile
 
 from cuke.errors import NoApiKey
 
 def make_request_in_api_key_order(func, cls, url, json=None, allow_anonymous=False,
-                                  anonymous_error_msg="", additional_headers=None):
+                                  anonymous_error_msg="", additional_headers=None, timeout=None, data=None):
+    headers = headers_in_api_key_order(cls, allow_anonymous, anonymous_error_msg, additional_headers)
+    if timeout is None:
+        timeout = cls._request_timeout
+    if data is not None:
+        resp = func(url, data=data, headers=headers, timeout=timeout)
+    elif json is not None:
+        resp = func(url, json=json, headers=headers, timeout=timeout)
+    else:
+        resp = func(url, headers=headers, timeout=timeout)
+    return resp
+
 
+def headers_in_api_key_order(cls, allow_anonymous=False, anonymous_error_msg="", additional_headers=None):
+    """Request headers authorized with the most privileged key `cls` has."""
     if cls._api_key is not None:
         headers = cls._headers(cls._api_key)
     elif cls._editor_key is not None:
@@ -19,14 +32,19 @@ def make_request_in_api_key_order(func, cls, url, json=None, allow_anonymous=Fal
             headers = cls._headers(None)
     if additional_headers is not None:
         headers.update(additional_headers)
-    if json is not None:
-        resp = func(url, json=json, headers=headers)
-    else:
-        resp = func(url, headers=headers)
-    return resp
+    return headers
+
+
+def digest(*chunks):
+    """Short content digest of `chunks` (bytes-like), for telling whether a value changed."""
+    h = hashlib.blake2b(digest_size=16)
+    for chunk in chunks:
+        h.update(chunk)
+    return h.digest()
 
 
 def get_function_body(func):
+    import inspect
     source_lines = inspect.getsourcelines(func)[0]
     source_lines = dropwhile(lambda x: x.startswith('@'), source_lines)
     line = next(source_lines).strip()
@@ -47,3 +65,16 @@ def add_header_to_function(body, name):
     func = f"def {name}(cuke):\n" + "\n".join(lines)
     exec(func)
     return locals()[name]
+
+
+class DeferredFunction:
+    """A function fetched from a page, only compiled with `add_header_to_function` when first called."""
+    def __init__(self, body, name):
+        self.body = body
+        self.__name__ = name
+        self._fn = None
+
+    def __call__(self, *args, **kwargs):
+        if self._fn is None:
+            self._fn = add_header_to_function(self.body, self.__name__)
+        return self._fn(*args, **kwargs)
@@ -0,0 +1,28 @@
+import pytest
+
+from cuke import Cuke
+from cuke.testing import StubServer
+
+
+@pytest.fixture
+def stub():
+    with StubServer() as server:
+        yield server
+
+
+@pytest.fixture
+def make_page(stub):
+    """
+    Makes pages on `stub`: make_page(template, values=None, **kwargs) publishes `template` and
+    `values` with a Cuke made with `kwargs`, and returns it.
+    """
+    def make(template="{{ x }}", values=None, **kwargs):
+        if "api_key" not in kwargs:
+            kwargs.setdefault("user_agent", "python-client-test")
+        page = Cuke(url=stub.url, **kwargs)
+        page._template = template
+        for k, v in (values or {}).items():
+            setattr(page, k, v)
+        page._update()
+        return page
+    return make
@@ -0,0 +1,136 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("httpx")
+
+from cuke.aio import AsyncCuke, close_async_clients
+
+
+def test_async_update_and_create(stub):
+    async def main():
+        c = AsyncCuke(user_agent="python-client-test", url=stub.url)
+        c._template = "iz nice {{ x }}"
+        c.x = "to meet you"
+        assert "x" in c._dirty_set
+        resp = await c._update()
+        assert resp["x"] == {"type": "basic", "value": "to meet you"}
+        assert not c._dirty_set
+        d = await AsyncCuke.create(user_agent="python-client-test", url=stub.url, page_slug=c._page_slug,
+                                   page_id=c._page_id, editor_key=c._editor_key)
+        assert d.x == "to meet you"
+        assert d._template == "iz nice {{ x }}"
+        await close_async_clients()
+    asyncio.run(main())
+
+
+def test_async_many_pages_concurrently(stub):
+    async def main():
+        cukes = [AsyncCuke(user_agent="python-client-test", url=stub.url) for _ in range(20)]
+        for i, c in enumerate(cukes):
+            c._template = "{{ i }}"
+            c.i = i
+        await asyncio.gather(*(c._update() for c in cukes))
+        await close_async_clients()
+        return cukes
+    cukes = asyncio.run(main())
+    assert {stub.page(c._page_id)["vars"]["i"]["value"] for c in cukes} == set(range(20))
+
+
+def test_async_instant_updates_and_remote_call(stub):
+    stub.functions["double"] = lambda: 42
+    async def main():
+        c = AsyncCuke(user_agent="python-client-test", url=stub.url)
+        c._template = "{{ x }}"
+        await c._update()
+        c._instant_updates = True
+        c.x = 1
+        c.x = 2
+        await c._flush()
+        assert stub.page(c._page_id)["vars"]["x"]["value"] == 2
+        c._vars["double"] = lambda cuke: None
+        assert await c.double() == "42"
+        await close_async_clients()
+    asyncio.run(main())
+
+
+def test_async_lazy_keys(stub):
+    from cuke.errors import KeyNotLoaded
+    async def main():
+        c = AsyncCuke(user_agent="python-client-test", url=stub.url)
+        c._template = "{{ x }}"
+        c.x = 1
+        c.y = 2
+        await c._update()
+        d = await AsyncCuke.create(user_agent="python-client-test", url=stub.url, page_slug=c._page_slug,
+                                   page_id=c._page_id, editor_key=c._editor_key, lazy_keys=True)
+        with pytest.raises(KeyNotLoaded):
+            d.x
+        await d._prefetch("x", "y")
+        assert (d.x, d.y) == (1, 2)
+        await close_async_clients()
+    asyncio.run(main())
+
+
+def test_async_sync(stub):
+    async def main():
+        a = AsyncCuke(user_agent="python-client-test", url=stub.url)
+        a._template = "{{ x }}"
+        a.x = 1
+        await a._update()
+        b = await AsyncCuke.create(user_agent="python-client-test", url=stub.url, page_slug=a._page_slug,
+                                   page_id=a._page_id, editor_key=a._editor_key)
+        a.x = 2
+        await a._update()
+        b.y = 3
+        result = await b._sync()
+        assert result.changed == ["x"] and b.x == 2
+        assert stub.page(a._page_id)["vars"]["y"]["value"] == 3
+        await close_async_clients()
+    asyncio.run(main())
+
+
+def test_async_lazy_alias(stub):
+    from cuke import aliases
+    from cuke.errors import AliasNotFetched
+    aliases.invalidate()
+    async def main():
+        c = AsyncCuke(url=stub.url, api_key="key", page_id="lazy", lazy_alias=True)
+        with pytest.raises(AliasNotFetched):
+            c._page_slug
+        d = await AsyncCuke.create(url=stub.url, api_key="key", page_id="lazy", lazy_alias=True, lazy=True)
+        assert d._page_slug == stub.alias
+        d._template = "{{ x }}"
+        d.x = 1
+        await d._update()
+        await close_async_clients()
+    asyncio.run(main())
+    assert stub.page("lazy")["vars"]["x"]["value"] == 1
+
+
+def test_async_background_updater_wakes_on_change_and_retries(stub):
+    async def main():
+        c = AsyncCuke(user_agent="python-client-test", url=stub.url)
+        c._template = "{{ x }}"
+        await c._update()
+        c._start(update_interval=0.2)
+        c._updater.backoff_base = 0.05
+        before = len(stub.requests_to("store/"))
+        await asyncio.sleep(0.3)
+        assert len(stub.requests_to("store/")) == before  # nothing dirty, nothing sent
+        stub.fail_next("store", times=2)
+        c.x = 1
+        deadline = asyncio.get_running_loop().time() + 3
+        while c._updater.last_success is None and asyncio.get_running_loop().time() < deadline:
+            await asyncio.sleep(0.02)
+        status = c._updater_status
+        assert status["queue_depth"] == 0
+        assert status["last_success"] is not None
+        assert status["last_error"] is not None
+        assert status["failures"] == 0
+        assert stub.page(c._page_id)["vars"]["x"]["value"] == 1
+        c._stop()
+        await asyncio.sleep(0)
+        assert not c._is_running
+        await close_async_clients()
+    asyncio.run(main())
@@ -0,0 +1,38 @@
+from cuke import Cuke, aliases
+
+
+def test_alias_cached_per_key(stub):
+    Cuke(url=stub.url, api_key="one", page_id="a")
+    Cuke(url=stub.url, api_key="one", page_id="b")
+    assert len(stub.requests_to("user")) == 1
+    Cuke(url=stub.url, api_key="two", page_id="c")
+    assert len(stub.requests_to("user")) == 2
+    aliases.invalidate(stub.url, "one")
+    c = Cuke(url=stub.url, api_key="one", page_id="d")
+    assert len(stub.requests_to("user")) == 3
+    assert c._page_slug == "testuser"
+
+
+def test_alias_cache_on_disk(stub, tmp_path, monkeypatch):
+    path = tmp_path / "aliases.json"
+    monkeypatch.setenv("CUKE_ALIAS_CACHE", str(path))
+    Cuke(url=stub.url, api_key="disk", page_id="a")
+    assert "disk" not in path.read_text()  # keys are stored hashed
+    aliases._aliases.clear()  # as if in a new process
+    Cuke(url=stub.url, api_key="disk", page_id="b")
+    assert len(stub.requests_to("user")) == 1
+
+    aliases.invalidate()
+    Cuke(url=stub.url, api_key="disk", page_id="c")
+    assert len(stub.requests_to("user")) == 2
+
+
+def test_lazy_alias(stub):
+    c = Cuke(url=stub.url, api_key="lazy", page_id="p", lazy_alias=True, connect=False)
+    assert not stub.requests_to("user")
+    c._template = "{{ x }}"
+    c.x = 1
+    c._update()
+    assert len(stub.requests_to("user")) == 1
+    assert c._page_slug == "testuser"
+    assert stub.page("p")["vars"]["x"]["value"] == 1
@@ -0,0 +1,98 @@
+import asyncio
+
+import pytest
+
+from cuke import Cuke, aliases
+from cuke.batch import CukeBatch
+from cuke.errors import PageNotFound
+
+
+def make_pages(stub, n, cls=Cuke, **kwargs):
+    if "api_key" in kwargs:
+        cukes = [cls(url=stub.url, page_id=f"page{i}", **kwargs) for i in range(n)]
+    else:
+        cukes = [cls(user_agent="python-client-test", url=stub.url, **kwargs) for _ in range(n)]
+    for i, c in enumerate(cukes):
+        c._template = "{{ i }}"
+        c.i = i
+    return cukes
+
+
+def test_bulk_update_sends_pages_concurrently(stub):
+    stub.delay = 0.1
+    cukes = make_pages(stub, 16)
+    results = CukeBatch(cukes, concurrency=8).update()
+    assert [r.cuke for r in results] == cukes
+    assert all(r.error is None for r in results)
+    assert {stub.page(c._page_id)["vars"]["i"]["value"] for c in cukes} == set(range(16))
+    assert stub.connections <= 8
+
+    for c in cukes:
+        c.i += 100
+    results = Cuke._bulk_update(cukes)
+    assert all(r.update["i"]["value"] >= 100 for r in results)
+
+
+def test_bulk_update_reports_failures_per_page(stub):
+    cukes = make_pages(stub, 4)
+    Cuke._bulk_update(cukes)
+    for c in cukes:
+        c.i = -1
+    stub.fail_next("store")
+    results = Cuke._bulk_update(cukes, concurrency=1)
+    assert results[0].error is not None and "i" in cukes[0]._dirty_set
+    assert all(r.error is None and r.update["i"]["value"] == -1 for r in results[1:])
+
+
+def test_async_bulk_update(stub):
+    pytest.importorskip("httpx")
+    from cuke.aio import AsyncCuke, close_async_clients
+
+    async def main():
+        cukes = make_pages(stub, 10, AsyncCuke)
+        results = await AsyncCuke._bulk_update(cukes, concurrency=4)
+        await close_async_clients()
+        return cukes, results
+    cukes, results = asyncio.run(main())
+    assert all(r.error is None for r in results)
+    assert {stub.page(c._page_id)["vars"]["i"]["value"] for c in cukes} == set(range(10))
+
+
+def test_bulk_open_looks_alias_up_once(stub):
+    cukes = make_pages(stub, 6, api_key="key")
+    Cuke._bulk_update(cukes)
+    pages = [c._page_id for c in cukes[:5]] + [{"page_id": "nonexistent", "editor_key": "k"}]
+    aliases.invalidate()
+    stub.requests.clear()
+    opened, report = Cuke._bulk_open(pages, api_key="key", url=stub.url)
+    assert len(stub.requests_to("user")) == 1
+    assert [c.i for c in opened[:5]] == [0, 1, 2, 3, 4]
+    assert all(not c._dirty_set for c in opened[:5])
+    assert opened[5] is None and isinstance(report.errors["nonexistent"], PageNotFound)
+    assert len(report.pages) == 6 and report.total >= max(report.pages.values())
+    assert "pages=6" in repr(report)
+
+
+def test_bulk_open_reports_failures(stub):
+    cukes = make_pages(stub, 3, api_key="key")
+    Cuke._bulk_update(cukes)
+    stub.fail_next("retrieve")
+    opened, report = Cuke._bulk_open([c._page_id for c in cukes], api_key="key", url=stub.url, concurrency=1)
+    assert opened[0] is None and cukes[0]._page_id in report.errors
+    assert [c.i for c in opened[1:]] == [1, 2]
+
+
+def test_async_bulk_open(stub):
+    pytest.importorskip("httpx")
+    from cuke.aio import AsyncCuke, close_async_clients
+    cukes = make_pages(stub, 4, api_key="key")
+    Cuke._bulk_update(cukes)
+
+    async def main():
+        opened, report = await AsyncCuke._bulk_open([c._page_id for c in cukes] + ["nonexistent"], api_key="key",
+                                                    url=stub.url)
+        await close_async_clients()
+        return opened, report
+    opened, report = asyncio.run(main())
+    assert [c.i for c in opened[:4]] == [0, 1, 2, 3]
+    assert opened[4] is None and list(report.errors) == ["nonexistent"]
@@ -0,0 +1,84 @@
+import base64
+
+import pytest
+import requests
+
+from cuke.types import Image
+
+
+TEMPLATE = "{{ img }} {{ table }}"
+CHUNKED = {"chunk_threshold": 1000, "chunk_size": 256}
+
+
+def test_large_values_uploaded_in_chunks(stub, make_page):
+    c = make_page(TEMPLATE, **CHUNKED)
+    data = bytes(range(256)) * 9 + b"end"
+    c.img = Image(data=data)
+    c.table = [[i, str(i)] for i in range(200)]
+    c.small = 1
+    update = c._update()
+    assert len(update["img"]["chunks"]) == 10 and update["img"]["size"] == len(data)
+    assert update["table"]["json"] is True
+    body = stub.requests_to("store", "POST")[-1][3]
+    assert data not in body and b"end" not in body
+    stored = stub.page(c._page_id)["vars"]
+    assert base64.b64decode(stored["img"]["value"]) == data
+    assert stored["table"]["value"] == [[i, str(i)] for i in range(200)]
+    assert stored["small"] == {"type": "basic", "value": 1}
+    # bytes(range(256)) repeats, so its nine chunks share one hash.
+    assert len(stub.requests_to("chunk/")) == len(stub.chunks)
+
+
+def test_failed_chunk_upload_resumes(stub, make_page):
+    c = make_page(TEMPLATE, **CHUNKED)
+    data = bytes(i % 251 for i in range(5000))
+    c.img = Image(data=data)
+    stub.fail_next("chunk")
+    with pytest.raises(requests.HTTPError):
+        c._update()
+    assert "img" in c._dirty_set
+    uploaded = len(stub.requests_to("chunk/"))
+    assert uploaded == 20 and len(stub.chunks) == 19
+    assert c._update()
+    assert len(stub.requests_to("chunk/")) == uploaded + 1
+    assert base64.b64decode(stub.page(c._page_id)["vars"]["img"]["value"]) == data
+
+
+def test_chunks_streamed_from_files(stub, make_page, tmp_path):
+    path = tmp_path / "big.png"
+    path.write_bytes(bytes(i % 7 for i in range(3000)))
+    c = make_page(TEMPLATE, **CHUNKED, binary_uploads=True)
+    c.img = Image(path=str(path))
+    assert "chunks" in c._update()["img"]
+    assert base64.b64decode(stub.page(c._page_id)["vars"]["img"]["value"]) == path.read_bytes()
+
+
+def test_blobs_shared_between_pages(stub, make_page):
+    from cuke import chunks
+    data = bytes(i % 253 for i in range(4000))
+    first = make_page(TEMPLATE, **CHUNKED)
+    first.img = Image(data=data)
+    first._update()
+    uploads = len(stub.requests_to("chunk/"))
+    assert uploads == 16 and len(stub.requests_to("chunks")) == 1
+
+    second = make_page(TEMPLATE, **CHUNKED)
+    second.img = Image(data=data)
+    second._update()
+    assert len(stub.requests_to("chunk/")) == uploads
+    assert len(stub.requests_to("chunks")) == 1  # known from the first page, so not even checked
+
+    chunks.forget(stub.url)
+    third = make_page(TEMPLATE, **CHUNKED)
+    third.img = Image(data=data)
+    third._update()
+    assert len(stub.requests_to("chunk/")) == uploads
+    assert len(stub.requests_to("chunks")) == 2
+
+    stub.chunks.clear()  # the server lost them; the client still thinks it has them
+    fourth = make_page(TEMPLATE, **CHUNKED)
+    fourth.img = Image(data=data)
+    fourth._update()
+    assert len(stub.requests_to("chunk/")) == 2 * uploads
+    for c in (first, second, third, fourth):
+        assert base64.b64decode(stub.page(c._page_id)["vars"]["img"]["value"]) == data
@@ -0,0 +1,52 @@
+import gzip
+
+import pytest
+
+from cuke import Cuke
+
+
+@pytest.mark.parametrize("method", ["gzip", "zstd"])
+def test_store_bodies_compressed(stub, method):
+    if method == "zstd":
+        pytest.importorskip("zstandard")
+    c = Cuke(user_agent="python-client-test", url=stub.url, compression=method, compression_threshold=100)
+    c._template = "{{ table }}" * 50
+    c.table = [{"name": "row", "value": i} for i in range(500)]
+    c._update()
+    for _, _, headers, body in stub.requests_to("store"):
+        assert headers["Content-Encoding"] == method
+    assert len(stub.requests_to("store", "POST")[-1][3]) < 2000
+    assert stub.page(c._page_id)["vars"]["table"]["value"][-1] == {"name": "row", "value": 499}
+    assert stub.page(c._page_id)["__template__"] == "{{ table }}" * 50
+
+    c.small = 1
+    c._dedupe = False
+    c._update()
+    assert "Content-Encoding" not in stub.requests_to("store", "POST")[-1][2]
+
+
+def test_compressed_once_per_body(stub, monkeypatch):
+    from cuke import compress
+    c = Cuke(user_agent="python-client-test", url=stub.url, compression="gzip", compression_threshold=10)
+    calls = []
+    monkeypatch.setattr(compress, "compress", lambda data, *args: calls.append(data) or gzip.compress(data))
+    c._template = "{{ x }}"
+    c._update()
+    c.x = list(range(100))
+    stub.fail_next("store")
+    with pytest.raises(Exception):
+        c._update()
+    c._update()
+    assert len(calls) == 2  # the template, then the update - compressed once, sent twice
+    assert stub.page(c._page_id)["vars"]["x"]["value"] == list(range(100))
+
+
+def test_falls_back_when_server_refuses(stub):
+    stub.accept_encodings = ()
+    c = Cuke(user_agent="python-client-test", url=stub.url, compression="gzip", compression_threshold=10)
+    c._template = "{{ x }}" * 10
+    c.x = list(range(100))
+    c._update()
+    assert stub.page(c._page_id)["vars"]["x"]["value"] == list(range(100))
+    assert [r[0] for r in stub.requests_to("store_template")] == ["POST", "POST"]
+    assert "Content-Encoding" not in stub.requests_to("store", "POST")[-1][2]
@@ -0,0 +1,42 @@
+import copy
+import json
+
+from cuke import Cuke
+from cuke.delta import apply_patch, diff
+
+
+def test_diff_roundtrip():
+    old = {"a": [1, 2, 3], "b": {"c": 1, "d/e": "x"}, "gone": True}
+    new = {"a": [1, 5], "b": {"c": 2, "d/e": "x", "f": None}, "added": [1]}
+    patch = diff(old, new)
+    assert apply_patch(copy.deepcopy(old), patch) == new
+    assert diff(new, new) == []
+    assert diff([1, 2], [1, 2, 3]) == [{"op": "add", "path": "/-", "value": 3}]
+
+
+def test_large_value_sent_as_delta(stub):
+    c = Cuke(user_agent="python-client-test", url=stub.url, delta_updates=True)
+    c._template = "{{ state }}"
+    c._update()
+    state = {"rows": [{"id": i, "name": f"row {i}"} for i in range(5000)], "tick": 0}
+    c.state = state
+    c._update()
+    full_size = len(stub.requests[-1][3])
+    state["tick"] = 1
+    c.state = state
+    update = c._update()
+    assert update["state"]["type"] == "delta"
+    assert len(stub.requests[-1][3]) < 200 < full_size
+    assert stub.page(c._page_id)["vars"]["state"]["value"] == json.loads(json.dumps(state))
+
+    # Another writer changes the value on the server: the stale delta is refused and resent whole.
+    d = Cuke(user_agent="python-client-test", url=stub.url, page_slug=c._page_slug, page_id=c._page_id,
+             editor_key=c._editor_key, delta_updates=True)
+    d.state = {"rows": [], "tick": 99}
+    d._update()
+    state["tick"] = 2
+    c.state = state
+    c._update()
+    assert b'"delta"' in stub.requests[-2][3]
+    assert len(stub.requests[-1][3]) > full_size / 2
+    assert stub.page(c._page_id)["vars"]["state"]["value"]["tick"] == 2
@@ -0,0 +1,105 @@
+import subprocess
+import sys
+
+from cuke import Cuke
+
+
+def test_import_is_light():
+    code = "import sys, cuke; print(sorted(m for m in ('requests', 'urllib3', 'inspect', 'concurrent.futures') if m in sys.modules))"
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+    assert out.strip() == "[]"
+
+
+def test_lazy_constructor_does_no_io_until_needed(stub):
+    page = Cuke(url=stub.url, api_key="key", page_id="lazy")
+    page._template = "{{ x }} {{ y }}"
+    page.x = 1
+    page.y = 2
+    page._update()
+    stub.requests.clear()
+
+    c = Cuke(url="http://127.0.0.1:1", api_key="unreachable", page_id="lazy", lazy=True)  # nothing to connect to
+    c = Cuke(url=stub.url, api_key="key", page_id="lazy", lazy=True)
+    assert not stub.requests
+    c.y = 20
+    assert c.x == 1
+    assert c.y == 20 and c._dirty_set == {"y"}
+    assert c._template == "{{ x }} {{ y }}"
+    assert c._update()["y"]["value"] == 20
+    assert stub.page("lazy")["vars"]["y"]["value"] == 20
+
+
+def test_lazy_constructor_fetches_on_first_read_of_a_setting(stub):
+    page = Cuke(url=stub.url, api_key="key", page_id="settings")
+    page._template = "{{ x }}"
+    page._title = "Lazy"
+    page.x = 1
+    page._update()
+
+    c = Cuke(url=stub.url, api_key="key", page_id="settings", lazy=True)
+    assert (c._template, c._title) == ("{{ x }}", "Lazy")
+    assert c.x == 1 and not c._dirty_set
+
+    c = Cuke(url=stub.url, api_key="key", page_id="settings", lazy=True)
+    c._template = "{{ x }}!"
+    assert c._title == "Lazy" and c._template == "{{ x }}!" and c._dirty_set == {"_template"}
+
+
+def test_lazy_constructor_fetches_before_first_flush(stub):
+    page = Cuke(url=stub.url, api_key="key", page_id="flushed")
+    page._template = "{{ x }}"
+    page.x = [1, 2, 3]
+    page._update()
+
+    c = Cuke(url=stub.url, api_key="key", page_id="flushed", lazy=True)
+    c.z = 1
+    update = c._update()
+    assert set(update) == {"__meta__", "z"}  # the template came from the server, so it isn't resent
+    assert c.x == [1, 2, 3]
+
+
+def double(cuke):
+    return cuke.x * 2
+
+
+def retrieves(stub):
+    return [path for method, path, _, _ in stub.requests if path.startswith("/retrieve/")]
+
+
+def test_lazy_keys_fetch_values_on_first_read(stub):
+    page = Cuke(url=stub.url, api_key="key", page_id="keys")
+    page._template = "{{ x }} {{ y }}"
+    page.x = "x" * 10000
+    page.y = 2
+    page.z = 3
+    page.double = double
+    page._update()
+    stub.requests.clear()
+
+    c = Cuke(url=stub.url, api_key="key", page_id="keys", lazy_keys=True, prefetch=["y"])
+    assert set(c._unloaded) == {"x", "z", "double"}
+    assert c._unloaded["x"]["size"] > 10000
+    assert c.y == 2 and len(retrieves(stub)) == 1
+    c.z = 30  # assigned before it was fetched: the local value wins
+    assert c.x == "x" * 10000
+    assert len(retrieves(stub)) == 2 and "keys=x" in retrieves(stub)[-1]
+    c._prefetch("x", "z")
+    assert len(retrieves(stub)) == 2
+    assert c.z == 30 and c._dirty_set == {"z"}
+    assert c._template == "{{ x }} {{ y }}"
+
+
+def test_functions_compiled_when_called(stub):
+    page = Cuke(url=stub.url, api_key="key", page_id="funcs")
+    page._template = "{{ x }}"
+    page.x = 21
+    page.double = double
+    page._update()
+
+    c = Cuke(url=stub.url, api_key="key", page_id="funcs")
+    fn = c._vars["double"]
+    assert fn._fn is None
+    assert fn(c) == 42 and fn._fn is not None
+    c.double = fn  # resending a fetched function sends its body
+    c._update()
+    assert stub.page("funcs")["vars"]["double"]["value"] == fn.body
@@ -0,0 +1,57 @@
+import os
+
+from cuke import Cuke, pagecache
+
+
+def test_warm_start_revalidates(stub, make_page, tmp_path, monkeypatch):
+    monkeypatch.setenv("CUKE_PAGE_CACHE", str(tmp_path))
+    page = make_page(values={"x": "x" * 10}, api_key="key", page_id="warm")
+    stub.requests.clear()
+    Cuke(url=stub.url, api_key="key", page_id="warm")  # cold: downloads and caches
+    assert len(os.listdir(tmp_path)) == 1
+
+    stub.requests.clear()
+    c = Cuke(url=stub.url, api_key="key", page_id="warm")
+    (_, _, headers, _), = stub.requests_to("retrieve")
+    assert headers["If-None-Match"]
+    assert c.x == "x" * 10 and c._template == "{{ x }}" and not c._dirty_set
+
+    page.x = "changed"
+    page._update()
+    assert Cuke(url=stub.url, api_key="key", page_id="warm").x == "changed"
+    assert Cuke(url=stub.url, api_key="key", page_id="warm").x == "changed"
+
+
+def test_evicts_least_recently_used(stub, make_page, tmp_path, monkeypatch):
+    monkeypatch.setenv("CUKE_PAGE_CACHE", str(tmp_path))
+    make_page(values={"x": "x" * 1000}, api_key="key", page_id="a")
+    Cuke(url=stub.url, api_key="key", page_id="a")
+    size, = [os.path.getsize(tmp_path / name) for name in os.listdir(tmp_path)]
+    monkeypatch.setitem(pagecache._config, "max_bytes", size * 2.5)
+    for page_id in ("b", "c"):
+        make_page(values={"x": "x" * 1000}, api_key="key", page_id=page_id)
+        Cuke(url=stub.url, api_key="key", page_id=page_id)
+    assert len(os.listdir(tmp_path)) == 2
+    pagecache.invalidate()
+    assert not os.listdir(tmp_path)
+
+
+def test_corrupt_file_is_a_miss(stub, make_page, tmp_path, monkeypatch):
+    monkeypatch.setenv("CUKE_PAGE_CACHE", str(tmp_path))
+    make_page(values={"x": "x" * 10}, api_key="key", page_id="corrupt")
+    Cuke(url=stub.url, api_key="key", page_id="corrupt")
+    for name in os.listdir(tmp_path):
+        (tmp_path / name).write_text("{not json")
+    assert Cuke(url=stub.url, api_key="key", page_id="corrupt").x == "x" * 10
+
+
+def test_basic_auth_pages_arent_cached(stub, make_page, tmp_path, monkeypatch):
+    monkeypatch.setenv("CUKE_PAGE_CACHE", str(tmp_path))
+    page = make_page(values={"x": "x" * 10}, api_key="key", page_id="private")
+    Cuke(url=stub.url, api_key="key", page_id="private")
+    assert len(os.listdir(tmp_path)) == 1
+    page._basic_auth = {"username": "u", "password": "hunter2"}
+    page._update()
+    c = Cuke(url=stub.url, api_key="key", page_id="private")
+    assert c._basic_auth == {"username": "u", "password": "hunter2"}
+    assert not os.listdir(tmp_path)
@@ -0,0 +1,110 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+
+@pytest.fixture
+def make_page(make_page):
+    """Pages declaring a remote function `add`."""
+    def make():
+        c = make_page()
+        c._vars["add"] = lambda cuke, a, b=0: None
+        return c
+    return make
+
+
+def test_call_with_arguments(stub, make_page):
+    stub.functions["add"] = lambda a, b=0: a + b
+    c = make_page()
+    assert c.add(2, b=3) == "5"
+    assert c.add.submit(4).result() == "4"
+
+
+def test_map_bounded_and_ordered(stub, make_page):
+    state = {"in_flight": 0, "most": 0}
+    lock = threading.Lock()
+
+    def add(a):
+        with lock:
+            state["in_flight"] += 1
+            state["most"] = max(state["most"], state["in_flight"])
+        time.sleep(0.02 if a % 2 else 0.001)
+        with lock:
+            state["in_flight"] -= 1
+        return a
+    stub.functions["add"] = add
+    c = make_page()
+    assert list(c.add.map(range(12), concurrency=4)) == [str(i) for i in range(12)]
+    assert 1 < state["most"] <= 4
+    unordered = list(c.add.map(iter(range(12)), concurrency=4, ordered=False))
+    assert sorted(unordered, key=lambda p: p[0]) == [(i, str(i)) for i in range(12)]
+
+
+def test_map_raises_the_failed_call(stub, make_page):
+    stub.functions["add"] = lambda a: 1 / a
+    c = make_page()
+    results = c.add.map([1, 0, 2], concurrency=2)
+    assert next(results) == "1.0"
+    with pytest.raises(Exception):
+        next(results)
+
+
+def test_async_map(stub):
+    pytest.importorskip("httpx")
+    from cuke.aio import AsyncCuke, close_async_clients
+    stub.functions["add"] = lambda a, b=0: a + b
+
+    async def main():
+        c = AsyncCuke(user_agent="python-client-test", url=stub.url)
+        c._template = "{{ x }}"
+        await c._update()
+        c._vars["add"] = lambda cuke, a, b=0: None
+        assert await c.add(1, b=2) == "3"
+        results = [r async for r in c.add.map(range(10), concurrency=3)]
+        await close_async_clients()
+        return results
+    assert asyncio.run(main()) == [str(i) for i in range(10)]
+
+
+def execute_requests(stub):
+    return [r for r in stub.requests if "/execute/" in r[1]]
+
+
+def test_result_cache_ttl_and_revalidation(stub, make_page):
+    from cuke.results import ResultCache
+    calls = []
+    stub.functions["add"] = lambda a, b=0: calls.append((a, b)) or a + b
+    c = make_page()
+    c._result_cache = ResultCache(ttl=60)
+    stub.requests.clear()
+    assert c.add(1, b=2) == "3"
+    assert c.add(1, b=2) == "3"
+    assert c.add(2) == "2"
+    assert len(execute_requests(stub)) == 2 and c._result_cache.hits == 1
+
+    c._result_cache.ttl = 0  # stale straight away: revalidated with the ETag
+    c._result_cache.clear()
+    stub.requests.clear()
+    assert c.add(5) == "5"
+    assert c.add(5) == "5"
+    first, second = execute_requests(stub)
+    assert "If-None-Match" not in first[2] and second[2]["If-None-Match"]
+    assert c._result_cache.revalidated == 1
+
+
+def test_result_cache_keys_on_source_and_evicts(stub, make_page):
+    from cuke.results import ResultCache
+    stub.functions["add"] = lambda a: a
+    c = make_page()
+    c._result_cache = cache = ResultCache(max_entries=2)
+    for a in (1, 2, 3):
+        c.add(a)
+    assert len(cache) == 2
+    stub.requests.clear()
+    c.add(3)
+    assert not execute_requests(stub)
+    c._vars["add"] = lambda cuke, a: a + 1  # the function changed, so its results did too
+    c.add(3)
+    assert len(execute_requests(stub)) == 1
@@ -0,0 +1,199 @@
+import base64
+import datetime
+import json
+import time
+
+import pytest
+
+from cuke import Cuke
+from cuke.types import Image
+from cuke.serializers import register, serializer_for, unregister
+
+
+class Celsius(float):
+    pass
+
+
+class Point:
+    def __init__(self, x, y):
+        self.x, self.y = x, y
+
+
+class Point3(Point):
+    pass
+
+
+def test_registry_resolves_by_mro(make_page):
+    @register(Point)
+    def point(value):
+        return {"type": "basic", "value": [value.x, value.y]}
+    try:
+        assert serializer_for(Point3) is point
+        assert serializer_for(Celsius) is None
+        c = make_page("{{ p }}")
+        c.p = Point3(1, 2)
+        c.q = object()
+        update = c._update()
+        assert update["p"] == {"type": "basic", "value": [1, 2]}
+        assert update["q"]["type"] == "error"
+    finally:
+        unregister(Point)
+    assert serializer_for(Point3) is None
+
+
+def test_numpy_arrays_sent_as_raw_buffers(make_page):
+    np = pytest.importorskip("numpy")
+    c = make_page("{{ p }}")
+    a = np.arange(12, dtype=np.float32).reshape(3, 4)[:, ::2]
+    c.a = a
+    c.n = np.int64(3)
+    update = c._update()
+    assert update["a"]["type"] == "ndarray"
+    assert update["a"]["shape"] == [3, 2]
+    decoded = np.frombuffer(base64.b64decode(update["a"]["value"]), dtype=update["a"]["dtype"])
+    assert (decoded.reshape(update["a"]["shape"]) == a).all()
+    assert update["n"] == {"type": "basic", "value": 3}
+
+    big = np.random.rand(1_000_000)
+    start = time.perf_counter()
+    entry = serializer_for(type(big))(big)
+    assert time.perf_counter() - start < 0.05
+    assert entry["value"].nbytes == big.nbytes
+
+
+@pytest.mark.parametrize("backend", ["json", "orjson"])
+def test_body_encoded_once_from_fragments(stub, make_page, backend):
+    from cuke import encoding
+    if backend == "orjson":
+        pytest.importorskip("orjson")
+    encoding.use_backend(backend)
+    try:
+        c = make_page("{{ p }}")
+        c.p = {"a": [1, 2.5, None], "b": "ü"}
+        c.q = float("nan")
+        c._title = "t"
+        update = c._update()
+        body = json.loads(stub.requests[-1][3])
+        assert body["__meta__"] == {"_title": "t"}
+        assert body["p"] == {"type": "basic", "value": {"a": [1, 2.5, None], "b": "ü"}}
+        assert update["p"]["value"] is c.p
+        assert body["q"]["type"] == "error"
+        c.d = datetime.date(2024, 1, 2)
+        c.n = [1, {"x": float("inf"), "y": None}]
+        update = c._update()
+        assert update["d"]["type"] == "error" and update["n"]["type"] == "error"
+    finally:
+        encoding.use_backend()
+
+
+def test_binary_values_sent_as_multipart_parts(stub):
+    c = Cuke(user_agent="python-client-test", url=stub.url, binary_uploads=True, dedupe=True)
+    c._template = "{{ img }}"
+    c._update()
+    data = bytes(range(256)) * 100
+    c.img = Image(data=data)
+    c.x = 1
+    update = c._update()
+    assert update["img"] == {"type": "png_b64", "part": "part1"}
+    headers, body = stub.requests[-1][2], stub.requests[-1][3]
+    assert headers["Content-Type"].startswith("multipart/form-data")
+    assert data in body and base64.b64encode(data) not in body
+    stored = stub.page(c._page_id)["vars"]
+    assert base64.b64decode(stored["img"]["value"]) == data
+    assert stored["x"] == {"type": "basic", "value": 1}
+
+    c.img = Image(data=data)
+    assert c._update() is False
+    c.img = Image(data=data[::-1])
+    assert "img" in c._update()
+    assert base64.b64decode(stub.page(c._page_id)["vars"]["img"]["value"]) == data[::-1]
+
+
+def test_bad_figure_options_are_rejected_up_front(stub):
+    with pytest.raises(ValueError):
+        Cuke(user_agent="python-client-test", url=stub.url, figure_options={"plot": {"format": "gif"}})
+    with pytest.raises(TypeError):
+        Cuke(user_agent="python-client-test", url=stub.url, figure_options={"plot": {"colour": "red"}})
+
+
+def test_figures_rendered_once_until_changed(stub):
+    matplotlib = pytest.importorskip("matplotlib")
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    c = Cuke(user_agent="python-client-test", url=stub.url, figure_options={"small": {"format": "jpeg", "dpi": 20}},
+             dedupe=True)
+    c._template = "{{ fig }} {{ small }}"
+    c._update()
+    fig, ax = plt.subplots()
+    line, = ax.plot([1, 2, 3])
+    calls = []
+    savefig = fig.savefig
+    fig.savefig = lambda *args, **kwargs: calls.append(kwargs["format"]) or savefig(*args, **kwargs)
+    c.fig = fig
+    c.small = fig
+    update = c._update()
+    assert update["fig"]["type"] == "png_b64" and update["small"]["type"] == "jpeg_b64"
+    assert sorted(calls) == ["jpeg", "png"]
+
+    c.fig = fig
+    assert c._update() is False
+    assert len(calls) == 2
+
+    line.set_ydata([3, 2, 1])
+    c.fig = fig
+    assert "fig" in c._update()
+    assert len(calls) == 3
+    plt.close(fig)
+
+
+@pytest.mark.parametrize("binary_uploads", [False, True])
+def test_image_files_streamed_and_resent_only_when_changed(stub, tmp_path, binary_uploads):
+    path = tmp_path / "frame.png"
+    path.write_bytes(b"first" * 1000)
+    c = Cuke(user_agent="python-client-test", url=stub.url, binary_uploads=binary_uploads)
+    c._template = "{{ img }}"
+    c._update()
+    img = Image(path=str(path))
+    c.img = img
+    assert "img" in c._update()
+    assert img._data is None
+    stored = lambda: base64.b64decode(stub.page(c._page_id)["vars"]["img"]["value"])
+    assert stored() == b"first" * 1000
+
+    c.img = img
+    assert c._update() is False
+    path.write_bytes(b"second" * 2000)
+    c.img = img
+    assert "img" in c._update()
+    assert stored() == b"second" * 2000
+
+    stub.page(c._page_id)["vars"]["img"] = {"type": "basic", "value": "replaced"}
+    c._revision = None  # fetch the whole state, as the stub doesn't record the edit above
+    c._sync()
+    c.img = img
+    assert "img" in c._update()  # the server no longer has the file
+
+
+def test_image_with_path_and_data_sends_the_data(stub, tmp_path):
+    path = tmp_path / "frame.png"
+    path.write_bytes(b"on disk")
+    c = Cuke(user_agent="python-client-test", url=stub.url, dedupe=True)
+    c._template = "{{ img }}"
+    c._update()
+    c.img = Image(path=str(path), data=b"first")
+    c._update()
+    c.img = Image(path=str(path), data=b"second")
+    assert "img" in c._update()
+    assert base64.b64decode(stub.page(c._page_id)["vars"]["img"]["value"]) == b"second"
+
+
+def test_binary_part_names_dont_collide_with_the_json_part(stub):
+    c = Cuke(user_agent="python-client-test", url=stub.url, binary_uploads=True)
+    c._template = "{{ json }} {{ part1 }}"
+    c._update()
+    c.json = Image(data=b"first image")
+    c.part1 = Image(data=b"second image")
+    c._update()
+    stored = stub.page(c._page_id)["vars"]
+    assert base64.b64decode(stored["json"]["value"]) == b"first image"
+    assert base64.b64decode(stored["part1"]["value"]) == b"second image"
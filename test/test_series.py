@@ -0,0 +1,83 @@
+from cuke import Cuke
+from cuke.types import Series
+
+
+def test_series_sends_only_new_points(stub, make_page):
+    c = make_page("{{ loss }}")
+    losses = Series()
+    losses.extend(range(1000))
+    c.loss = losses
+    assert c._update()["loss"]["type"] == "series"
+    losses.extend([1000, 1001])
+    c.loss = losses
+    update = c._update()
+    assert update["loss"] == {"type": "series_append", "id": losses.id, "start": 1000, "points": [1000, 1001],
+                              "tail": []}
+    assert stub.page(c._page_id)["vars"]["loss"]["points"] == list(range(1002))
+
+
+def test_series_ring_buffer_and_resync(stub, make_page):
+    c = make_page("{{ loss }}")
+    losses = Series(maxlen=10)
+    losses.extend(range(25))
+    c.loss = losses
+    c._update()
+    stored = stub.page(c._page_id)["vars"]["loss"]
+    assert stored["start"] == 15 and stored["points"] == list(range(15, 25))
+    losses.extend(range(25, 30))
+    c.loss = losses
+    c._update()
+    assert stored["start"] == 20 and stored["points"] == list(range(20, 30))
+
+    # The server lost track (another client replaced the value): the append is refused and resent whole.
+    stub.page(c._page_id)["vars"]["loss"] = {"type": "basic", "value": None}
+    losses.append(30)
+    c.loss = losses
+    c._update()
+    assert stub.page(c._page_id)["vars"]["loss"]["points"] == list(range(21, 31))
+
+
+def test_series_downsampling():
+    values = [(-1) ** i * i for i in range(1000)]
+    for method in ("minmax", "mean", "lttb"):
+        s = Series(values, downsample=method, bucket=100)
+        entry, end = s._entry()
+        assert len(s) == 1000
+        assert 0 < len(entry["points"]) <= 20
+        assert all(len(p) == 2 for p in entry["points"])
+        assert len(entry["points"]) + len(entry["tail"]) < 200
+    minmax = Series(values, downsample="minmax", bucket=100)._entry()[0]["points"]
+    assert minmax[:2] == [[98, 98], [99, -99]]
+
+
+def test_reattach_to_page_with_series(stub, tmp_path, monkeypatch):
+    monkeypatch.setenv("CUKE_PAGE_CACHE", str(tmp_path))
+    c = Cuke(url=stub.url, api_key="key", page_id="curves")
+    c._template = "{{ loss }}"
+    c.loss = Series(range(10), maxlen=8)
+    c._update()
+
+    d = Cuke(url=stub.url, api_key="key", page_id="curves")
+    assert list(d.loss._points) == list(range(2, 10))
+    d.loss.append(10)
+    d.loss = d.loss
+    assert d._update()["loss"]["type"] == "series_append"
+    assert stub.page("curves")["vars"]["loss"]["points"] == list(range(3, 11))
+
+    assert list(Cuke(url=stub.url, api_key="key", page_id="curves").loss._points)[-1] == 10  # from disk
+    (e,), report = Cuke._bulk_open(["curves"], url=stub.url, api_key="key")
+    assert not report.errors and e.loss.id == c.loss.id
+    lazy = Cuke(url=stub.url, api_key="key", page_id="curves", lazy_keys=True)
+    assert list(lazy.loss._points)[-1] == 10
+
+
+def test_reattached_series_keeps_its_bucket(stub):
+    c = Cuke(url=stub.url, api_key="key", page_id="buckets")
+    c._template = "{{ loss }}"
+    c.loss = Series(range(120), downsample="mean", bucket=50)
+    c._update()
+
+    d = Cuke(url=stub.url, api_key="key", page_id="buckets")
+    assert d.loss.bucket == 50
+    d.loss.extend(range(120, 150))
+    assert list(d.loss._points)[-1] == [100, 124.5]
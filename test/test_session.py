@@ -0,0 +1,37 @@
+import requests
+
+import cuke.session
+from cuke import Cuke
+
+
+def test_updates_reuse_one_connection(stub):
+    c = Cuke(user_agent="python-client-test", url=stub.url)
+    c._template = "iz nice {{ x }}"
+    c._update()
+    for i in range(5):
+        c.x = i
+        c._update()
+    d = Cuke(user_agent="python-client-test", url=stub.url, page_slug=c._page_slug,
+             page_id=c._page_id, editor_key=c._editor_key)
+    assert d.x == 4
+    assert len(stub.requests) == 7
+    assert stub.connections == 1
+
+
+def test_session_registry_keyed_by_base_url():
+    a = cuke.session.get_session("http://localhost:5000/store/x/y")
+    b = cuke.session.get_session("http://localhost:5000")
+    assert a is b
+    assert cuke.session.get_session("http://localhost:5001") is not a
+
+
+def test_injected_session_and_timeout(stub):
+    session = requests.Session()
+    seen = []
+    session.hooks["response"].append(lambda r, *args, **kwargs: seen.append(r.url))
+    c = Cuke(user_agent="python-client-test", url=stub.url, session=session, timeout=2)
+    assert c._request_timeout == 2
+    c._template = "hi"
+    c._update()
+    assert seen == [f"{stub.url}/store_template"]
+    assert "_session" not in c._dirty_set
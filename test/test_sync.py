@@ -0,0 +1,109 @@
+import pytest
+
+from cuke import Cuke
+
+
+def pages(stub):
+    a = Cuke(url=stub.url, api_key="key", page_id="shared")
+    a._template = "{{ x }} {{ y }}"
+    a.x = 1
+    a.y = 2
+    a._update()
+    return a, Cuke(url=stub.url, api_key="key", page_id="shared")
+
+
+def test_sync_merges_remote_changes_and_reports_conflicts(stub):
+    a, b = pages(stub)
+    a.x = 10
+    a.y = 30
+    a._update()
+    b.y = 20
+    stub.requests.clear()
+    result = b._sync()
+    assert all("since=" in path for _, path, _, _ in stub.requests_to("retrieve"))
+    assert result.changed == ["x"]
+    assert result.conflicts == {"y": 30}
+    assert (b.x, b.y) == (10, 20)
+    assert stub.page("shared")["vars"]["y"]["value"] == 20  # the local value won, and was sent
+    assert result.revision == b._revision
+
+    result = b._sync()  # its own write comes back, but isn't a change
+    assert result.changed == [] and result.conflicts == {} and result.update is False
+
+
+def test_sync_remote_wins_and_page_settings(stub):
+    a, b = pages(stub)
+    a._template = "{{ y }}"
+    a.y = 30
+    a._update()
+    b.y = 20
+    result = b._sync(on_conflict="remote")
+    assert result.conflicts == {"y": 30}
+    assert set(result.changed) == {"_template", "y"}
+    assert b.y == 30 and b._template == "{{ y }}"
+    assert not b._dirty_set and result.update is False
+
+
+def test_sync_without_revisions_merges_whole_state(stub):
+    a, b = pages(stub)
+    b._revision = None  # as with a server that doesn't track revisions
+    a.x = 5
+    a._update()
+    b.y = 7
+    result = b._sync()
+    assert result.changed == ["x"] and result.conflicts == {}
+    assert (b.x, b.y) == (5, 7)
+
+
+def test_sync_new_page_fetches_its_state(stub):
+    c = Cuke(url=stub.url, api_key="key", page_id="new")
+    assert c._views is None
+    c._template = "hello"
+    result = c._sync()
+    assert c._views == 0 and result.revision is not None
+    assert result.changed == [] and result.conflicts == {}
+
+
+def test_sync_keeps_series(stub):
+    from cuke.types import Series
+    c = Cuke(url=stub.url, api_key="key", page_id="curves")
+    c._template = "{{ loss }}"
+    c.loss = Series(range(5))
+    c._sync()
+    other = Cuke(url=stub.url, api_key="key", page_id="curves")
+    other.loss.extend([5, 6])
+    other.loss = other.loss
+    other._update()
+    result = c._sync()
+    assert result.changed == ["loss"] and not c._unloaded
+    assert list(c.loss._points) == list(range(7))
+
+
+def test_sync_doesnt_report_own_series_appends(stub):
+    from cuke.types import Series
+    c = Cuke(url=stub.url, api_key="key", page_id="appends")
+    c._template = "{{ loss }}"
+    losses = Series(range(5), downsample="mean", bucket=2)
+    c.loss = losses
+    c._sync()
+    losses.append(7)
+    c.loss = losses
+    result = c._sync()
+    assert result.changed == [] and c.loss is losses
+
+
+@pytest.mark.parametrize("binary_uploads", [False, True])
+def test_sync_doesnt_report_own_images(stub, tmp_path, binary_uploads):
+    from cuke.types import Image
+    path = tmp_path / "plot.png"
+    path.write_bytes(bytes(range(256)) * 5)
+    c = Cuke(url=stub.url, api_key="key", page_id="images", binary_uploads=binary_uploads)
+    c._template = "{{ img }} {{ file }}"
+    c.img = Image(data=bytes(range(100)))
+    c.file = Image(path=str(path))
+    result = c._sync()
+    assert result.changed == []
+    assert isinstance(c.img, Image) and isinstance(c.file, Image)
+    c.img = Image(data=bytes(range(50)))
+    result = c._sync()
+    assert result.changed == [] and c.img.data == bytes(range(50))
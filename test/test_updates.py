@@ -0,0 +1,140 @@
+import threading
+import time
+
+import pytest
+import requests
+
+from cuke import Cuke
+
+
+def test_setattr_does_not_wait_for_upload(stub, make_page):
+    c = make_page()
+    c.x = 1
+    stub.delay = 0.5
+    uploader = threading.Thread(target=c._update)
+    uploader.start()
+    time.sleep(0.1)
+    start = time.perf_counter()
+    c.x = 2
+    assert time.perf_counter() - start < 0.1
+    uploader.join()
+    assert c._dirty_set == {"x"}
+    stub.delay = 0
+    c._update()
+    assert stub.page(c._page_id)["vars"]["x"]["value"] == 2
+
+
+def test_failed_send_keeps_keys_dirty(stub, make_page):
+    c = make_page()
+    c.x = 1
+    c._title = "t"
+    stub.fail_next("store")
+    with pytest.raises(requests.exceptions.HTTPError):
+        c._update()
+    assert c._dirty_set == {"x", "_title"}
+    c._update()
+    assert not c._dirty_set
+    assert stub.page(c._page_id)["vars"]["x"]["value"] == 1
+    assert stub.page(c._page_id)["__title__"] == "t"
+
+
+def test_coalesced_instant_updates(stub, make_page):
+    c = make_page(instant_updates=True, coalesce_latency=0.1)
+    before = len(stub.requests_to("store/"))
+    for i in range(10):
+        setattr(c, f"v{i}", i)
+    assert len(stub.requests_to("store/")) == before
+    time.sleep(0.4)
+    assert len(stub.requests_to("store/")) == before + 1
+    assert stub.page(c._page_id)["vars"]["v9"]["value"] == 9
+    c._stop()
+
+
+def test_coalesced_batch_size_and_flush(stub, make_page):
+    c = make_page(instant_updates=True, coalesce_latency=10, coalesce_batch_size=3)
+    before = len(stub.requests_to("store/"))
+    c.a, c.b, c.c = 1, 2, 3
+    time.sleep(0.3)
+    assert len(stub.requests_to("store/")) == before + 1
+    c.d = 4
+    c._flush()
+    assert len(stub.requests_to("store/")) == before + 2
+    assert not c._dirty_set
+    c._stop()
+
+
+def test_background_updater_wakes_on_change_and_retries(stub, make_page):
+    c = make_page()
+    c._start(update_interval=0.2)
+    c._updater.backoff_base = 0.05
+    stub.fail_next("store", times=2)
+    c.x = 1
+    deadline = time.time() + 3
+    while c._updater.last_success is None and time.time() < deadline:
+        time.sleep(0.02)
+    status = c._updater_status
+    assert status["queue_depth"] == 0
+    assert status["last_success"] is not None
+    assert status["failures"] == 0
+    assert stub.page(c._page_id)["vars"]["x"]["value"] == 1
+    c._stop()
+    assert not c._is_running
+
+
+def test_stop_flushes_dirty_keys(stub, make_page):
+    c = make_page()
+    c._start(update_interval=60)
+    c.x = 1
+    time.sleep(0.1)
+    c.x = 2
+    c._stop()
+    assert stub.page(c._page_id)["vars"]["x"]["value"] == 2
+
+
+def test_unchanged_values_are_not_resent(stub, make_page):
+    c = make_page(dedupe=True)
+    c.big = list(range(1000))
+    c.x = 1
+    c._update()
+    c.big = list(range(1000))
+    c.x = 2
+    update = c._update()
+    assert "big" not in update and update["x"]["value"] == 2
+    assert c._bytes_saved > 1000
+    c.big = list(range(1000))
+    assert c._update() is False
+    assert len(stub.requests_to("store/")) == 2
+
+
+def test_dedupe_is_opt_in(make_page):
+    c = make_page()
+    c.x = 1
+    c._update()
+    c.x = 1
+    assert c._update()["x"]["value"] == 1
+    assert c._bytes_saved == 0
+
+
+def test_value_reset_after_a_server_side_change_is_sent(stub, make_page):
+    c = make_page()
+    c.likes = 0
+    c._update()
+    stub.page(c._page_id)["vars"]["likes"] = {"type": "basic", "value": 2}  # e.g. a button was clicked
+    c.likes = 0
+    assert c._update()["likes"]["value"] == 0
+    assert stub.page(c._page_id)["vars"]["likes"]["value"] == 0
+
+
+def test_dedupe_notices_server_side_changes_once_fetched(stub):
+    c = Cuke(url=stub.url, api_key="key", page_id="likes", dedupe=True)
+    c._template = "{{ likes }}"
+    c.likes = 0
+    c._update()
+    other = Cuke(url=stub.url, api_key="key", page_id="likes")
+    other.likes = 2
+    other._update()
+    c._sync()
+    assert c.likes == 2
+    c.likes = 0
+    assert c._update()["likes"]["value"] == 0
+    assert stub.page("likes")["vars"]["likes"]["value"] == 0